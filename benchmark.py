@@ -0,0 +1,585 @@
+"""Offline benchmarks of the data pipeline. They don't need network access.
+
+Examples:
+python benchmark.py merge --players 10000 --skip-loop
+python benchmark.py parse --fixtures work/fixtures
+python benchmark.py pool --players 1000 10000 100000 --clubs 18
+python benchmark.py replay --fixtures work/fixtures --game kicker
+
+With "--results FILE", the timings are appended to a JSON lines file together with
+the git commit. "python benchmark.py compare --results FILE" compares the commits.
+"""
+
+import argparse
+import datetime
+import json
+import logging
+from pathlib import Path
+import random
+import subprocess
+import time
+
+from bs4 import BeautifulSoup
+import numpy as np
+import pandas as pd
+
+import choose_team
+import common
+import game_sources
+import obtain_data
+from players import Position
+import solvers
+import store
+
+FIRST_NAMES = [
+    "Aleksandar", "Alphonso", "Anton", "Çağlar", "Dayot", "Enis", "Florian",
+    "Hugo", "Jamal", "Jonas", "Kerem", "Leroy", "Łukasz", "Manuel", "Min-jae",
+    "Nemanja", "Niklas", "Søren", "Thomas", "Zoë",
+]  # fmt: skip
+FAMILY_NAMES = [
+    "Aktürkoglu", "Bardhi", "Davies", "Gündoğan", "Hincapié", "Kim", "Larsson",
+    "Müller", "Musiala", "Neuer", "Nikolić", "Pavlović", "Sané", "Szczęsny",
+    "Upamecano", "Wirtz", "Zabolotnyi", "Ødegaard", "Çalhanoğlu", "Šeško",
+]  # fmt: skip
+
+
+def synthetic_names(count, seed=0):
+    """Create names of the form "first family". The family names get a random
+    suffix, so that there are only few duplicates."""
+    rng = random.Random(seed)
+    return [
+        f"{rng.choice(FIRST_NAMES)} {rng.choice(FAMILY_NAMES)}{rng.randrange(count)}"
+        for _ in range(count)
+    ]
+
+
+def synthetic_players(count, seed=0):
+    """Create the available players of the game and the transfermarkt players.
+    Most of the players are in both lists. The game uses abbreviated first
+    names."""
+    rng = random.Random(seed)
+    names = synthetic_names(count, seed)
+    transfermarkt_players = [
+        common.Player(name=name, nationality="club", market_value=10**6)
+        for name in names
+    ]
+    available_players = []
+    for name in rng.sample(names, k=int(0.9 * count)):
+        first_name, family_name = name.split(" ", 1)
+        available_players.append(
+            common.Player(
+                name=f"{first_name[0]}. {family_name}",
+                ingame_position=common.Position.FORWARD,
+                ingame_value=5 * 10**5,
+            )
+        )
+    return available_players, transfermarkt_players
+
+
+def synthetic_team_page(players=30, seed=0):
+    """Create a team page like the transfermarkt squad pages. Each player row
+    contains a nested table with name and position."""
+    rng = random.Random(seed)
+    market_values = ["-", "500 Tsd. €", "1,50 Mio. €", "12,00 Mio. €", "120,00 Mio. €"]
+    rows = []
+    for number, name in enumerate(synthetic_names(players, seed)):
+        rows.append(
+            f'<tr class="{"odd" if number % 2 == 0 else "even"}">'
+            f'<td class="zentriert rueckennummer">{number}</td>'
+            '<td class="posrela"><table class="inline-table">'
+            f'<tr><td rowspan="2"><img src="/portrait/{number}.jpg"/></td>'
+            f'<td class="hauptlink"><a href="/profil/spieler/{number}">{name} </a></td>'
+            "</tr><tr><td>Mittelfeld</td></tr></table></td>"
+            '<td class="zentriert">01.01.2000 (25)</td>'
+            f'<td class="rechts hauptlink"><a href="/marktwert/{number}">'
+            f"{rng.choice(market_values)}</a></td></tr>"
+        )
+    navigation = "<li><a href='/news'>News</a></li>" * 300
+    return (
+        f"<html><head><title>Kader</title></head><body><ul>{navigation}</ul>"
+        f'<table class="items"><thead><tr><th>#</th></tr></thead>'
+        f"<tbody>{''.join(rows)}</tbody></table><ul>{navigation}</ul></body></html>"
+    )
+
+
+def parse_team_page_soup(html, team_path):
+    """Reference implementation: "obtain_data.parse_team_page()" with
+    BeautifulSoup."""
+    soup = BeautifulSoup(html, "html.parser")
+    players_row = soup.find_all(attrs={"class": "even"}) + soup.find_all(
+        attrs={"class": "odd"}
+    )
+    data = []
+    for player in players_row:
+        info = player.find_all(class_="hauptlink")[0]
+        market_value = obtain_data.parse_market_value(
+            player.find_all(class_="rechts")[0].text
+        )
+        data.append(
+            {
+                "name_": info.text.strip(),
+                "market_value": market_value,
+                "nationality": team_path.split("/")[1],
+            }
+        )
+    return data
+
+
+def merge_player_data_loop(available_players, player_data_transfermarkt):
+    """Reference implementation: "obtain_data.merge_player_data()" with the nested
+    loop over all players."""
+    complete_players = []
+    for player in available_players:
+        possible_matches = []
+        for p in player_data_transfermarkt:
+            if p.family_name() == player.family_name():
+                possible_matches.append(p)
+            elif p.family_name(special_chars=False) == player.family_name(
+                special_chars=False
+            ):
+                possible_matches.append(p)
+            elif obtain_data.SPECIAL_MAPPINGS.get(player.name, "") == p.name:
+                possible_matches.append(p)
+
+        matched_player = None
+        if len(possible_matches) == 1:
+            matched_player = possible_matches[0]
+        elif possible_matches:
+            matched_player = obtain_data.match_first_letter(player, possible_matches)
+        if matched_player is not None:
+            complete_players.append(matched_player + player)
+    return complete_players
+
+
+def idfy_replace(name):
+    """Reference implementation: "common.idfy()" with sequential replacements."""
+    name_id = name.lower()
+    for replacement in common.IDFY_REPLACEMENTS.items():
+        name_id = name_id.replace(*replacement)
+    return name_id
+
+
+# Share of the positions in the player pool of a game.
+POSITION_SHARES = {
+    Position.GOALKEEPER: 0.12,
+    Position.DEFENDER: 0.33,
+    Position.MIDFIELDER: 0.35,
+    Position.FORWARD: 0.20,
+}
+
+
+def synthetic_pool(count, clubs=18, seed=0):
+    """Create a player pool like the merged player data. The market values are
+    log-normal distributed (median 2 Mio. €). The ingame costs grow with the
+    logarithm of the market value and are rounded to 0.1 Mio. € like in the games.
+    """
+    rng = np.random.default_rng(seed)
+    names = pd.Series(synthetic_names(count, seed))
+    # Make the names unique, since they identify the players.
+    duplicate = names.groupby(names).cumcount()
+    names = names.where(duplicate == 0, names + " " + (duplicate + 1).astype(str))
+
+    market_value = np.round(rng.lognormal(np.log(2 * 10**6), 1.3, count), -4)
+    cost_ingame = np.clip(
+        0.5 + 1.2 * np.log1p(market_value / 10**6) * rng.lognormal(0, 0.2, count),
+        0.5,
+        15.0,
+    )
+    return pd.DataFrame(
+        {
+            "name_": names,
+            "nationality": [f"club-{club}" for club in rng.integers(clubs, size=count)],
+            "position": rng.choice(
+                [position.name for position in POSITION_SHARES],
+                size=count,
+                p=list(POSITION_SHARES.values()),
+            ),
+            "cost_ingame": (np.round(cost_ingame, 1) * 10**6).astype("int64"),
+            "market_value": market_value.astype("int64"),
+        }
+    )
+
+
+# Results of the benchmarks of this run.
+RESULTS = []
+
+
+def report(step, seconds, **parameters):
+    """Print the wall time of a step and keep it for "--results"."""
+    print(f"{step}: {seconds:.3f} s")
+    RESULTS.append({"step": step, "seconds": seconds, "parameters": parameters})
+
+
+def git_commit():
+    """Short hash of the current commit. "-dirty" marks uncommitted changes."""
+    directory = Path(__file__).parent
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=directory,
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "diff", "--quiet", "HEAD"], cwd=directory
+        ).returncode
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-dirty" if dirty else "")
+
+
+def write_results(results_file, benchmark):
+    """Append the results of this run to a JSON lines file."""
+    run = {
+        "benchmark": benchmark,
+        "commit": git_commit(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+    }
+    with open(results_file, "a") as outfile:
+        for result in RESULTS:
+            outfile.write(json.dumps({**run, **result}) + "\n")
+
+
+def timed(function, *args, repeat=1):
+    """Return the best wall time of "repeat" runs and the result."""
+    best_time = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        best_time = min(best_time, time.perf_counter() - start)
+    return best_time, result
+
+
+def benchmark_merge(args):
+    available_players, transfermarkt_players = synthetic_players(args.players)
+    print(f"{len(available_players)} available x {len(transfermarkt_players)} players")
+
+    index_time, index_result = timed(
+        obtain_data.merge_player_data,
+        available_players,
+        transfermarkt_players,
+        repeat=args.repeat,
+    )
+    report("merge_player_data (index)", index_time, players=args.players)
+    if args.skip_loop:
+        return
+
+    loop_time, loop_result = timed(
+        merge_player_data_loop, available_players, transfermarkt_players
+    )
+    report("merge_player_data (loop)", loop_time, players=args.players)
+    assert index_result == loop_result, "Index and loop give different results."
+    print(f"Speedup: {loop_time / index_time:.1f}x, identical results.")
+
+
+def benchmark_idfy(args):
+    names = pd.Series(synthetic_names(args.names))
+    print(f"{len(names)} names, {names.nunique()} distinct")
+
+    replace_time, replace_result = timed(names.apply, idfy_replace, repeat=args.repeat)
+    report("idfy (sequential replace, apply)", replace_time, names=args.names)
+
+    common.idfy.cache_clear()
+    scalar_time, scalar_result = timed(names.apply, common.idfy, repeat=args.repeat)
+    report("idfy (translate, apply)", scalar_time, names=args.names)
+
+    common.idfy.cache_clear()
+    series_time, series_result = timed(common.idfy_series, names, repeat=args.repeat)
+    report("idfy_series", series_time, names=args.names)
+
+    assert replace_result.equals(scalar_result), "Scalar results differ."
+    assert replace_result.equals(series_result), "Series results differ."
+    print("Identical results.")
+
+
+def benchmark_parse(args):
+    if args.fixtures is not None:
+        pages = [path.read_text() for path in sorted(args.fixtures.glob("*.html"))]
+    else:
+        pages = [synthetic_team_page(args.players, seed) for seed in range(args.pages)]
+    team_path = "/team/startseite/verein/0/saison_id/2025"
+    print(f"{len(pages)} pages, {sum(len(page) for page in pages)} characters")
+
+    def parse_all(parse_function):
+        return [parse_function(page, team_path) for page in pages]
+
+    soup_time, soup_result = timed(parse_all, parse_team_page_soup, repeat=args.repeat)
+    report("parse_team_page (BeautifulSoup)", soup_time, pages=len(pages))
+    lxml_time, lxml_result = timed(
+        parse_all, obtain_data.parse_team_page, repeat=args.repeat
+    )
+    report("parse_team_page (lxml)", lxml_time, pages=len(pages))
+
+    # The row order differs: BeautifulSoup finds all even rows before the odd rows.
+    for soup_rows, lxml_rows in zip(soup_result, lxml_result):
+        assert sorted(soup_rows, key=str) == sorted(
+            lxml_rows, key=str
+        ), "Parsers give different results."
+    print(f"Speedup: {soup_time / lxml_time:.1f}x, identical results.")
+
+
+def benchmark_solve(dataframe, solver_names, builders, repeat=1, **parameters):
+    """Time building the model and solving it. Each solve uses a new backend, so
+    that no solution is reused."""
+    models = {}
+    for builder in builders:
+        build_time, models[builder] = timed(
+            choose_team.MODEL_BUILDERS[builder], dataframe, repeat=repeat
+        )
+        report(f"create_model ({builder})", build_time, **parameters)
+    model = models[builders[-1]]
+
+    objectives = {}
+    for solver in solver_names:
+        try:
+            solve_time, result = timed(
+                lambda: solvers.get_backend(solver).solve(model), repeat=repeat
+            )
+        except ValueError as error:  # for example unsupported by native backend
+            print(f"solve ({solver}) failed: {error}")
+            continue
+        report(f"solve ({solver})", solve_time, **parameters)
+        objectives[solver] = result.objective if result.optimal else None
+    print(f"Objectives: {objectives}")
+
+    # All builders have to reach the same optimum. The MIP gap is disabled, so
+    # that the objectives are comparable.
+    if len(models) > 1 and objectives:
+        solver = next(iter(objectives))
+        builder_objectives = {}
+        for builder, builder_model in models.items():
+            result = solvers.get_backend(solver, mip_gap=0).solve(builder_model)
+            builder_objectives[builder] = result.objective if result.optimal else None
+        print(f"Objectives of the builders ({solver}): {builder_objectives}")
+        assert (
+            len(set(builder_objectives.values())) == 1
+        ), "Builders give different optima."
+
+
+def benchmark_pool(args):
+    for count in args.players:
+        pool = synthetic_pool(count, args.clubs, args.seed)
+        print(f"{count} players, {args.clubs} clubs")
+        parameters = {"players": count, "clubs": args.clubs}
+
+        common.idfy.cache_clear()
+        idfy_time, _ = timed(common.idfy_series, pool.name_, repeat=args.repeat)
+        report("idfy_series", idfy_time, **parameters)
+
+        # The game and transfermarkt data of the pool in different order.
+        game = pool[["name_", "position", "cost_ingame"]]
+        transfermarkt = pool[["name_", "market_value", "nationality"]].sample(
+            frac=1, random_state=args.seed
+        )
+        merge_time, _ = timed(
+            lambda: game.merge(transfermarkt, on="name_", how="inner"),
+            repeat=args.repeat,
+        )
+        report("pandas merge", merge_time, **parameters)
+
+        available_players = [
+            common.Player(
+                name=name, ingame_position=Position[position], ingame_value=cost
+            )
+            for name, position, cost in game.itertuples(index=False)
+        ]
+        transfermarkt_players = [
+            common.Player(name=name, market_value=value, nationality=club)
+            for name, value, club in transfermarkt.itertuples(index=False)
+        ]
+        index_time, _ = timed(
+            obtain_data.merge_player_data,
+            available_players,
+            transfermarkt_players,
+            repeat=args.repeat,
+        )
+        report("merge_player_data (index)", index_time, **parameters)
+
+        benchmark_solve(
+            pool, args.solvers, args.builders, repeat=args.repeat, **parameters
+        )
+
+
+def benchmark_replay(args):
+    """Run the pipeline on recorded pages: The transfermarkt team pages (*.html,
+    named by the club) and the bulk download of the game (*.csv or *.json)."""
+    pages = {
+        path.stem: path.read_text() for path in sorted(args.fixtures.glob("*.html"))
+    }
+    source = game_sources.get_source(args.game, season=args.season)
+    game_files = sorted(
+        args.fixtures.glob("*.json" if args.game == "uefa" else "*.csv")
+    )
+    if not pages or not game_files:
+        raise ValueError(f"Missing team pages or game download in {args.fixtures}.")
+    game_content = game_files[0].read_bytes()
+    parameters = {"fixtures": str(args.fixtures), "game": args.game}
+    print(f"{len(pages)} team pages, {game_files[0].name}")
+
+    def parse_pages():
+        data = []
+        for club, page in pages.items():
+            data.extend(obtain_data.parse_team_page(page, f"/{club}/startseite"))
+        return pd.DataFrame(data)
+
+    parse_time, transfermarkt = timed(parse_pages, repeat=args.repeat)
+    report("parse_team_page (lxml)", parse_time, **parameters)
+    game_time, game = timed(source.parse_bulk, game_content, repeat=args.repeat)
+    report(f"parse_bulk ({args.game})", game_time, **parameters)
+
+    def idfy_names():
+        common.idfy.cache_clear()
+        return (
+            common.idfy_series(game.name_.str.lower()),
+            common.idfy_series(transfermarkt.name_),
+        )
+
+    idfy_time, (game["name_"], transfermarkt["name_"]) = timed(
+        idfy_names, repeat=args.repeat
+    )
+    report("idfy_series", idfy_time, **parameters)
+    merge_time, player_data = timed(
+        lambda: game.merge(transfermarkt, on="name_", how="inner"),
+        repeat=args.repeat,
+    )
+    report("pandas merge", merge_time, **parameters)
+    print(f"{len(game)} x {len(transfermarkt)} players, {len(player_data)} matches")
+
+    if player_data.empty:
+        print("No matches. Skipping the model.")
+        return
+    player_data = player_data.drop_duplicates("name_")
+    benchmark_solve(
+        player_data, args.solvers, args.builders, repeat=args.repeat, **parameters
+    )
+
+
+def compare(args):
+    """Print the best wall time of each step by commit."""
+    results = pd.read_json(args.results, lines=True)
+    results["parameters"] = results.parameters.map(
+        lambda parameters: ", ".join(f"{k}={v}" for k, v in parameters.items())
+    )
+    commits = results.groupby("commit", sort=False).date.min().sort_values()
+    table = results.pivot_table(
+        index=["benchmark", "step", "parameters"],
+        columns="commit",
+        values="seconds",
+        aggfunc="min",
+    )
+    table = table[commits.index[-args.last :]]
+    with pd.option_context("display.width", None, "display.max_colwidth", 40):
+        print(table.round(4).to_string())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--results",
+        default=None,
+        type=Path,
+        help="Append the timings to a JSON lines file for comparing commits.",
+    )
+    subparsers = parser.add_subparsers(required=True)
+
+    parser_merge = subparsers.add_parser(
+        "merge", help="Name matching of merge_player_data."
+    )
+    parser_merge.add_argument("--players", default=2000, type=int)
+    parser_merge.add_argument("--repeat", default=3, type=int)
+    parser_merge.add_argument(
+        "--skip-loop",
+        action="store_true",
+        help="Skip the nested loop reference. It is slow for many players.",
+    )
+    parser_merge.set_defaults(function=benchmark_merge)
+
+    parser_idfy = subparsers.add_parser("idfy", help="Name normalization.")
+    parser_idfy.add_argument("--names", default=100_000, type=int)
+    parser_idfy.add_argument("--repeat", default=3, type=int)
+    parser_idfy.set_defaults(function=benchmark_idfy)
+
+    parser_parse = subparsers.add_parser(
+        "parse", help="HTML parsing of the transfermarkt team pages."
+    )
+    parser_parse.add_argument(
+        "--fixtures",
+        default=None,
+        type=Path,
+        help="Directory with recorded team pages (*.html). Default: synthetic pages.",
+    )
+    parser_parse.add_argument("--pages", default=18, type=int)
+    parser_parse.add_argument("--players", default=30, type=int)
+    parser_parse.add_argument("--repeat", default=3, type=int)
+    parser_parse.set_defaults(function=benchmark_parse)
+
+    def add_solve_arguments(subparser):
+        subparser.add_argument(
+            "--solvers",
+            nargs="+",
+            choices=solvers.BACKENDS.keys(),
+            default=["highs", "native"],
+        )
+        subparser.add_argument(
+            "--builders",
+            nargs="+",
+            choices=choose_team.MODEL_BUILDERS.keys(),
+            default=["vectorized"],
+            help="The rules builder is slow for many players.",
+        )
+        subparser.add_argument("--repeat", default=1, type=int)
+
+    parser_pool = subparsers.add_parser(
+        "pool",
+        help="Name matching, model building and solving of synthetic player pools.",
+    )
+    parser_pool.add_argument("--players", nargs="+", default=[1000, 10_000], type=int)
+    parser_pool.add_argument("--clubs", default=18, type=int)
+    parser_pool.add_argument("--seed", default=0, type=int)
+    add_solve_arguments(parser_pool)
+    parser_pool.set_defaults(function=benchmark_pool)
+
+    parser_replay = subparsers.add_parser(
+        "replay", help="The whole pipeline on recorded pages."
+    )
+    parser_replay.add_argument(
+        "--fixtures",
+        required=True,
+        type=Path,
+        help=(
+            "Directory with the transfermarkt team pages (*.html) and the bulk "
+            "download of the game (*.csv or *.json)."
+        ),
+    )
+    parser_replay.add_argument(
+        "--game", choices=game_sources.GAME_SOURCES.keys(), default="kicker"
+    )
+    parser_replay.add_argument(
+        "--season",
+        default=store.CURRENT_SEASON,
+        help="Season of the game, for example 2020 for the UEFA EURO 2020 game.",
+    )
+    add_solve_arguments(parser_replay)
+    parser_replay.set_defaults(function=benchmark_replay)
+
+    parser_compare = subparsers.add_parser(
+        "compare", help="Compare the stored results by commit."
+    )
+    parser_compare.add_argument(
+        "--last", default=5, type=int, help="Number of commits to compare."
+    )
+    parser_compare.set_defaults(function=compare)
+
+    args = parser.parse_args()
+    if args.function is compare and args.results is None:
+        parser.error("compare requires --results.")
+    # Avoid measuring the logging. Warnings about the synthetic data are expected.
+    logging.disable(logging.WARNING)
+    args.function(args)
+    if args.results is not None and args.function is not compare:
+        write_results(args.results, args.function.__name__.removeprefix("benchmark_"))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,30 @@
 import argparse
 from pathlib import Path
 
-import pandas as pd
 import pyomo.environ as pyomo_env
-from pyomo.opt import SolverFactory
+from pyomo.core.expr.numeric_expr import LinearExpression
 from prettytable import PrettyTable
 
-from common import Position
-
-
-def create_model(dataframe):
-    # Configuration
-    expected_position_counts = {
-        Position.GOALKEEPER: 3,
-        Position.DEFENDER: 7,
-        Position.MIDFIELDER: 7,
-        Position.FORWARD: 5,
-    }
-    total_players = 22
-    players_per_nation = (0, 30)  # minimum 0, maximum 30 -> the limit got removed
-    maximum_ingame_value = 42.5 * 10**6  # million
-
-    # Define the actual model.
+import instrumentation
+from players import Position
+import solvers
+import starting_eleven
+
+# Configuration
+EXPECTED_POSITION_COUNTS = {
+    Position.GOALKEEPER: 3,
+    Position.DEFENDER: 7,
+    Position.MIDFIELDER: 7,
+    Position.FORWARD: 5,
+}
+TOTAL_PLAYERS = 22
+PLAYERS_PER_NATION = (0, 30)  # minimum 0, maximum 30 -> the limit got removed
+MAXIMUM_INGAME_VALUE = 42.5 * 10**6  # million
+
+
+def create_base_model(dataframe):
+    """Create the model with all sets, parameters and variables, but without any
+    objective or constraint."""
     model = pyomo_env.ConcreteModel()
 
     model.name_ = pyomo_env.Set(initialize=dataframe.name_.to_list())
@@ -31,7 +34,16 @@ def create_model(dataframe):
         within=pyomo_env.NonNegativeReals,
     )
     model.market_value = pyomo_env.Param(
-        model.name_, initialize=dict(zip(dataframe.name_, dataframe.market_value))
+        model.name_,
+        initialize=dict(zip(dataframe.name_, dataframe.market_value)),
+        within=pyomo_env.NonNegativeReals,
+    )
+    # Objective coefficient of each player. It is mutable to allow changing the
+    # weights of the metrics without rebuilding the model. Default: market value.
+    model.score = pyomo_env.Param(
+        model.name_,
+        initialize=dict(zip(dataframe.name_, dataframe.market_value)),
+        mutable=True,
     )
     model.nationality = pyomo_env.Param(
         model.name_,
@@ -39,82 +51,209 @@ def create_model(dataframe):
         within=pyomo_env.Any,
     )
     model.position = pyomo_env.Param(
-        model.name_, initialize=dict(zip(dataframe.name_, dataframe.position))
+        model.name_,
+        initialize=dict(zip(dataframe.name_, dataframe.position)),
+        within=pyomo_env.Any,
+    )
+
+    # Rules of the game. They are mutable to allow changing them without
+    # rebuilding the model.
+    model.expected_position_count = pyomo_env.Param(
+        list(Position), initialize=EXPECTED_POSITION_COUNTS, mutable=True
+    )
+    model.expected_total_players = pyomo_env.Param(
+        initialize=TOTAL_PLAYERS, mutable=True
+    )
+    model.players_per_nation_min = pyomo_env.Param(
+        initialize=PLAYERS_PER_NATION[0], mutable=True
+    )
+    model.players_per_nation_max = pyomo_env.Param(
+        initialize=PLAYERS_PER_NATION[1], mutable=True
+    )
+    model.maximum_ingame_value = pyomo_env.Param(
+        initialize=MAXIMUM_INGAME_VALUE, mutable=True
     )
 
     # Is the player chosen for the final team?
-    model.chosen = pyomo_env.Var(model.name_, within=pyomo_env.Boolean, initialize=1)
+    model.chosen = pyomo_env.Var(model.name_, within=pyomo_env.Boolean, initialize=0)
 
-    # Objective: Maximize the market value of the players.
-    def market_value_rule(model):
-        market_value_sum = sum(
-            model.market_value[i] * model.chosen[i] for i in model.name_
-        )
-        return market_value_sum
+    return model
 
-    model.average_market_value = pyomo_env.Objective(
-        rule=market_value_rule, sense=pyomo_env.maximize
-    )
+
+def create_model(dataframe):
+    """Create the model by rules. Each rule iterates over all players."""
+    model = create_base_model(dataframe)
+
+    # Objective: Maximize the score (by default the market value) of the players.
+    def score_rule(model):
+        return sum(model.score[i] * model.chosen[i] for i in model.name_)
+
+    model.total_score = pyomo_env.Objective(rule=score_rule, sense=pyomo_env.maximize)
 
     # Constraint: Ingame cost of the players.
     def cost_rule(model):
         value = sum(model.cost_ingame[i] * model.chosen[i] for i in model.name_)
-        return value <= maximum_ingame_value
+        return value <= model.maximum_ingame_value
 
     model.total_cost = pyomo_env.Constraint(rule=cost_rule)
 
     # Constraint: Amount of players for each position.
-    def position_rule(model, position, expected_count):
+    def position_rule(model, position):
         actual_count = sum(
             model.chosen[i] * int(model.position[i] == position.name)
             for i in model.name_
         )
-        return actual_count == expected_count
+        return actual_count == model.expected_position_count[position]
 
-    model.positions = pyomo_env.Constraint(
-        expected_position_counts.items(), rule=position_rule
-    )
+    model.positions = pyomo_env.Constraint(list(Position), rule=position_rule)
 
     # Constraint: Maximum team size.
     def total_players_rule(model):
         value = sum(model.chosen[i] for i in model.name_)
-        return value == total_players
+        return value == model.expected_total_players
 
     model.total_players = pyomo_env.Constraint(rule=total_players_rule)
 
     # Constraint: Amount of players of each national team.
-    def nationality_rule(model, nation, count_min, count_max):
+    def nationality_rule(model, nation):
         actual_count = sum(
             model.chosen[i] * int(model.nationality[i] == nation) for i in model.name_
         )
-        return pyomo_env.inequality(count_min, actual_count, count_max)
+        return pyomo_env.inequality(
+            model.players_per_nation_min, actual_count, model.players_per_nation_max
+        )
 
-    expected_nation_counts = {
-        nation: players_per_nation for nation in set(dataframe.nationality.to_list())
-    }
     model.nationalities = pyomo_env.Constraint(
-        expected_nation_counts.items(), rule=nationality_rule
+        list(set(dataframe.nationality.to_list())), rule=nationality_rule
     )
 
     return model
 
 
+def create_model_vectorized(dataframe):
+    """Create the same model as "create_model()", but build the linear expressions
+    directly from the dataframe columns. The players are grouped in a single pass
+    instead of scanning all players for each position and nation."""
+    model = create_base_model(dataframe)
+
+    chosen = [model.chosen[name] for name in dataframe.name_]
+    position_indices = dataframe.groupby("position", sort=False).indices
+    nation_indices = dataframe.groupby("nationality", sort=False).indices
+
+    def linear_sum(indices, coefficients=None):
+        variables = [chosen[index] for index in indices]
+        if coefficients is None:
+            coefficients = [1] * len(variables)
+        else:
+            coefficients = coefficients[indices].tolist()
+        return LinearExpression(
+            constant=0, linear_coefs=coefficients, linear_vars=variables
+        )
+
+    all_indices = range(len(chosen))
+
+    # Objective: Maximize the score (by default the market value) of the players.
+    model.total_score = pyomo_env.Objective(
+        expr=LinearExpression(
+            constant=0,
+            linear_coefs=[model.score[name] for name in dataframe.name_],
+            linear_vars=chosen,
+        ),
+        sense=pyomo_env.maximize,
+    )
+
+    # Constraint: Ingame cost of the players.
+    model.total_cost = pyomo_env.Constraint(
+        expr=linear_sum(all_indices, dataframe.cost_ingame.to_numpy())
+        <= model.maximum_ingame_value
+    )
+
+    # Constraint: Amount of players for each position.
+    def position_rule(model, position):
+        return (
+            linear_sum(position_indices.get(position.name, []))
+            == model.expected_position_count[position]
+        )
+
+    model.positions = pyomo_env.Constraint(list(Position), rule=position_rule)
+
+    # Constraint: Maximum team size.
+    model.total_players = pyomo_env.Constraint(
+        expr=linear_sum(all_indices) == model.expected_total_players
+    )
+
+    # Constraint: Amount of players of each national team.
+    def nationality_rule(model, nation):
+        return pyomo_env.inequality(
+            model.players_per_nation_min,
+            linear_sum(nation_indices[nation]),
+            model.players_per_nation_max,
+        )
+
+    model.nationalities = pyomo_env.Constraint(
+        list(nation_indices), rule=nationality_rule
+    )
+
+    return model
+
+
+MODEL_BUILDERS = {
+    "rules": create_model,
+    "vectorized": create_model_vectorized,
+}
+
+
+def set_scores(model, scores):
+    """Set the objective coefficients. The scores are in order of the players."""
+    model.score.store_values(dict(zip(model.name_, scores)))
+
+
+def solve_top_k(model, backend, top_k, min_difference=1):
+    """Find the "top_k" best lineups. After each solve, the found lineup is excluded
+    by a no-good cut: The next lineup has to differ by at least "min_difference"
+    players. The model is built only once and the cuts are added incrementally.
+
+    Yield the result of each solve. The model contains the corresponding lineup
+    until the next lineup is requested.
+    """
+    if hasattr(model, "no_good_cuts"):  # cuts of a previous call
+        model.del_component(model.no_good_cuts)
+    model.no_good_cuts = pyomo_env.ConstraintList()
+    for _ in range(top_k):
+        result = backend.solve(model)
+        if not result.optimal:
+            break
+        yield result
+
+        team = [i for i in model.name_ if pyomo_env.value(model.chosen[i]) > 0.5]
+        model.no_good_cuts.add(
+            LinearExpression(
+                constant=0,
+                linear_coefs=[1] * len(team),
+                linear_vars=[model.chosen[i] for i in team],
+            )
+            <= len(team) - min_difference
+        )
+
+
 def print_results(model):
     total_ingame_sum = 0
     total_market_value = 0
     team = []
+    with_starting_eleven = hasattr(model, "starting")
     for i in model.name_:
-        if bool(pyomo_env.value(model.chosen[i])):
-            team.append(
-                (
-                    Position[model.position[i]],
-                    i,
-                    model.nationality[i],
-                    model.cost_ingame[i] / 1000000.0,
-                    model.market_value[i] / 1000000.0,
-                    f"{model.market_value[i] / model.cost_ingame[i]:.2f}",
-                )
+        if pyomo_env.value(model.chosen[i]) > 0.5:
+            player = (
+                Position[model.position[i]],
+                i,
+                model.nationality[i],
+                model.cost_ingame[i] / 1000000.0,
+                model.market_value[i] / 1000000.0,
+                f"{model.market_value[i] / model.cost_ingame[i]:.2f}",
             )
+            if with_starting_eleven:
+                player += ("x" if pyomo_env.value(model.starting[i]) > 0.5 else "",)
+            team.append(player)
             total_ingame_sum += model.cost_ingame[i]
             total_market_value += model.market_value[i]
 
@@ -127,25 +266,29 @@ def print_results(model):
         "Market value [Mio. €]",
         "Ratio (market / ingame)",
     ]
+    total = (
+        "-",
+        "Total",
+        "",
+        total_ingame_sum / 1000000.0,
+        total_market_value / 1000000.0,
+        f"{total_market_value / total_ingame_sum:.2f}",
+    )
+    if with_starting_eleven:
+        table.field_names += ["Starting"]
+        total += (starting_eleven.chosen_formation(model),)
     for player in sorted(team):
         table.add_row(player)
-    table.add_row(
-        (
-            "-",
-            "Total",
-            "",
-            total_ingame_sum / 1000000.0,
-            total_market_value / 1000000.0,
-            f"{total_market_value / total_ingame_sum:.2f}",
-        )
-    )
+    table.add_row(total)
     print(table)
 
 
 def print_top_ratios(data):
     print("Top Ratios:")
     df_top_ratios = (
-        data[["name_", "nationality", "position", "cost_ingame", "market_value", "ratio"]]
+        data[
+            ["name_", "nationality", "position", "cost_ingame", "market_value", "ratio"]
+        ]
         .sort_values("ratio", ascending=False)
         .head(20)
     )
@@ -153,6 +296,11 @@ def print_top_ratios(data):
 
 
 def main():
+    # Pandas is imported only by the scripts, which read the player data. The
+    # modules, which only build and solve the model, start faster without it.
+    import features
+    import store
+
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "--force", action="store_true", help="Force refreshing of the cache."
@@ -168,25 +316,179 @@ def main():
         action="store_true",
         help="Show players with the baes ratio (market value / ingame value).",
     )
+    parser.add_argument(
+        "--model-builder",
+        choices=MODEL_BUILDERS.keys(),
+        default="vectorized",
+        help="How to build the model. Both builders create the same model.",
+    )
+    parser.add_argument(
+        "--solver",
+        choices=solvers.BACKENDS.keys(),
+        default="glpk",
+        help="Solver backend. highs and scipy solve in-process.",
+    )
+    parser.add_argument(
+        "--time-limit", default=None, type=float, help="Solver time limit in seconds."
+    )
+    parser.add_argument(
+        "--mip-gap", default=None, type=float, help="Relative MIP gap tolerance."
+    )
+    parser.add_argument(
+        "--threads", default=None, type=int, help="Number of solver threads."
+    )
+    parser.add_argument(
+        "--top-k",
+        default=1,
+        type=int,
+        help="Show the best N lineups instead of only the best lineup.",
+    )
+    parser.add_argument(
+        "--min-difference",
+        default=1,
+        type=int,
+        help="Minimum amount of different players between the top-k lineups.",
+    )
+    parser.add_argument(
+        "--metrics",
+        action="append",
+        default=[],
+        type=Path,
+        help=(
+            'Csv file with the column "name_" and additional metrics of the '
+            "players. Can be given multiple times."
+        ),
+    )
+    parser.add_argument(
+        "--weights",
+        action="append",
+        default=[],
+        type=features.parse_weights,
+        help=(
+            "Weights of the metrics for the expected points, for example "
+            f"market_value=1,rating=0.5. Known metrics: {', '.join(features.METRICS)}. "
+            "Can be given multiple times to compare the lineups. The model is "
+            "built only once. Default: market value only."
+        ),
+    )
+    parser.add_argument(
+        "--formations",
+        default=None,
+        help=(
+            "Choose the starting eleven, too. Comma separated allowed formations, "
+            "for example 3-4-3,4-4-2,4-5-1."
+        ),
+    )
+    parser.add_argument(
+        "--bench-weight",
+        default=0.1,
+        type=float,
+        help="Weight of the whole squad relative to the starting eleven.",
+    )
+    parser.add_argument(
+        "--save-squad",
+        default=None,
+        type=Path,
+        help=(
+            "Write the chosen players to a file. It can be used by "
+            "starting_eleven.py to choose the starting eleven of each matchday."
+        ),
+    )
+    parser.add_argument(
+        "--statistics",
+        default=None,
+        type=Path,
+        help="Write the timers and counters of all stages to a JSON file.",
+    )
+    parser.add_argument(
+        "--profile",
+        action="append",
+        default=[],
+        help=(
+            'Profile a stage by cProfile: "read", "create_model" or "solve". "all" '
+            "profiles all stages. The profiles are written to work/profiles."
+        ),
+    )
+    parser.add_argument(
+        "--season",
+        default=store.CURRENT_SEASON,
+        help="First year of the season of the player data, for example 2025.",
+    )
     args = parser.parse_args()
+    instrumentation.statistics.profile_stages.update(args.profile)
+
+    with instrumentation.stage("read"):
+        dataframe = store.read(
+            store.ROOT,
+            "players",
+            args.season,
+            store.PLAYERS_SCHEMA,
+            columns=store.PLAYERS_SCHEMA.names,
+        )
+        if dataframe is None:
+            raise Exception("No player data found. Run obtain_data.py first.")
+        dataframe["ratio"] = dataframe["market_value"] / dataframe["cost_ingame"]
+
+        if args.exclude_list is not None:
+            exclude_list = args.exclude_list.read_text().split("\n")
+            dataframe = dataframe[~dataframe["name_"].isin(exclude_list)]
+
+        dataframe = features.join_metrics(dataframe, args.metrics)
+        instrumentation.count("players", len(dataframe))
+
+    with instrumentation.stage("create_model"):
+        model = MODEL_BUILDERS[args.model_builder](dataframe)
+        if args.formations is not None:
+            starting_eleven.add_starting_eleven(
+                model,
+                starting_eleven.parse_formations(args.formations),
+                args.bench_weight,
+            )
+        instrumentation.count("variables", model.nvariables())
+        instrumentation.count("constraints", model.nconstraints())
+
+    backend = solvers.get_backend(
+        args.solver,
+        time_limit=args.time_limit,
+        mip_gap=args.mip_gap,
+        threads=args.threads,
+    )
 
-    dataframe = pd.read_csv("work/test.csv")
-    dataframe["ratio"] = dataframe["market_value"] / dataframe["cost_ingame"]
-
-    if args.exclude_list is not None:
-        exclude_list = args.exclude_list.read_text().split("\n")
-        dataframe = dataframe[~dataframe["name_"].isin(exclude_list)]
-
-    model = create_model(dataframe)
-
-    opt = SolverFactory("glpk")
-    opt.solve(model)
-
-    print_results(model)
+    # The feature matrix is built only once. Each weighting only changes the
+    # objective coefficients.
+    metrics = list(dict.fromkeys(m for weights in args.weights for m in weights))
+    matrix = features.feature_matrix(dataframe, metrics)
+    for weights in args.weights or [None]:
+        if weights is not None:
+            set_scores(model, features.expected_points(matrix, metrics, weights))
+            print(f"Weights: {weights}")
+
+        if args.top_k == 1:
+            result = backend.solve(model)
+            print_results(model)
+            print(f"Solved with {result.backend} in {result.wall_time:.3f} s.")
+        else:
+            lineup_count = 0
+            for lineup_count, result in enumerate(
+                solve_top_k(model, backend, args.top_k, args.min_difference), start=1
+            ):
+                print(f"Lineup {lineup_count}:")
+                print_results(model)
+                print(f"Solved with {result.backend} in {result.wall_time:.3f} s.")
+            if lineup_count < args.top_k:
+                print(f"Found only {lineup_count} lineups.")
+
+    if args.save_squad is not None:
+        args.save_squad.write_text(
+            "\n".join(i for i in model.name_ if pyomo_env.value(model.chosen[i]) > 0.5)
+        )
 
     if args.show_top_ratios:
         print_top_ratios(dataframe)  # Only for information.
 
+    if args.statistics is not None:
+        instrumentation.statistics.write_json(args.statistics)
+
 
 if __name__ == "__main__":
     main()
@@ -1,88 +1,43 @@
-from dataclasses import dataclass, fields
-import enum
+from concurrent.futures import ThreadPoolExecutor
 import functools
-from typing import Optional
-
-from selenium import webdriver
-import requests
-
-
-# TODO: Check for better datatype: https://stackoverflow.com/q/31537316/7410886
-class Position(enum.Enum):
-    GOALKEEPER = 0
-    # TW = 0
-    # DEFENSE = 1
-    DEFENDER = 1
-    # AW = 1
-    # MIDFIELD = 2
-    MIDFIELDER = 2
-    # MF = 2
-    # OFFENSE = 3
-    FORWARD = 3
-    # ST = 3
-
-    def __lt__(self, other):
-        return self.value < other.value
-
-
-@dataclass(unsafe_hash=True)
-class Player:
-    """Represents a player with real as well as game stats."""
-
-    name: str
-    nationality: Optional[str] = None
-    id_transfermarkt_de: Optional[int] = None
-    market_value: Optional[int] = None
-    ingame_position: Optional[Position] = None
-    ingame_value: Optional[int] = None
-
-    def first_name(self, special_chars=True):
-        name_parts = self.name.split(" ", 1)
-        if len(name_parts) == 2:
-            first_name = name_parts[0].lower()
-        else:
-            first_name = None
-        if not special_chars:
-            first_name = idfy(first_name)
-        return first_name
-
-    def family_name(self, special_chars=True):
-        name_parts = self.name.split(" ", 1)
-        if len(name_parts) == 2:
-            family_name = name_parts[1].lower()
-        else:
-            family_name = self.name.lower()
-        if not special_chars:
-            family_name = idfy(family_name)
-        return family_name
-
-    def __add__(self, other):
-        for field in fields(Player)[
-            1:
-        ]:  # Name has to be assigned at both. Take the name of the first player.
-            value_self = getattr(self, field.name)
-            value_other = getattr(other, field.name)
-            if value_self is not None and value_other is not None:
-                raise ValueError(
-                    f"Can't add players. Too many values for {field.name}: {self} + {other}."
-                )
-
-        return Player(
-            self.name,
-            self.nationality if self.nationality is not None else other.nationality,
-            (
-                self.id_transfermarkt_de
-                if self.id_transfermarkt_de is not None
-                else other.id_transfermarkt_de
-            ),
-            self.market_value if self.market_value is not None else other.market_value,
-            (
-                self.ingame_position
-                if self.ingame_position is not None
-                else other.ingame_position
-            ),
-            self.ingame_value if self.ingame_value is not None else other.ingame_value,
-        )
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import instrumentation
+
+# The players are re-exported for compatibility.
+from players import (  # noqa: F401
+    IDFY_REPLACEMENTS,
+    IDFY_TABLE,
+    PLAYER_COLUMNS,
+    Player,
+    Position,
+    idfy,
+    idfy_series,
+    players_from_dataframe,
+    players_to_dataframe,
+    strip_accents,
+)
+
+# HTTP cache of all sessions. Disabled if None.
+http_cache = None
+
+
+def create_session():
+    """Create a session, which uses the HTTP cache if enabled."""
+    # Requests is imported only when a session is needed, since it slows down the
+    # startup of the scripts, which only solve.
+    import requests
+
+    from http_cache import CachedSession
+
+    session = requests.Session() if http_cache is None else CachedSession(http_cache)
+    session.headers.update({"User-Agent": "Custom user agent"})
+    session.hooks["response"].append(instrumentation.count_response)
+    return session
 
 
 def with_session(func):
@@ -90,63 +45,91 @@ def with_session(func):
 
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        with requests.Session() as session:
-            session.headers.update({"User-Agent": "Custom user agent"})
+        with create_session() as session:
             return func(session, *args, **kwargs)
 
     return wrapper
 
 
+class RateLimiter:
+    """Limit the amount of requests per second for each host. Thread safe."""
+
+    def __init__(self, requests_per_second):
+        self.interval = 1.0 / requests_per_second
+        self.next_request = {}
+        self.lock = threading.Lock()
+
+    def wait(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            request_time = max(now, self.next_request.get(host, now))
+            self.next_request[host] = request_time + self.interval
+        time.sleep(request_time - now)
+
+
+def get_with_retries(session, url, retries=5, backoff=0.5, rate_limiter=None):
+    """Get the page. Retry with exponential backoff and jitter if it's a server
+    issue."""
+    import requests
+
+    for attempt in range(retries):
+        if rate_limiter is not None:
+            rate_limiter.wait(url)
+        try:
+            page = session.get(url)
+        except requests.ConnectionError as error:
+            if attempt == retries - 1:
+                raise
+            logging.debug(f"{error=}. Trying again.")
+        else:
+            if page.status_code != 429 and page.status_code < 500:
+                break
+            logging.debug(f"{page.status_code=}. Trying again.")
+        if attempt < retries - 1:
+            instrumentation.count("retries")
+            time.sleep(backoff * 2**attempt * random.uniform(0.5, 1.5))
+    page.raise_for_status()
+    return page
+
+
+def get_concurrently(
+    session, urls, concurrency=8, requests_per_second=None, **retry_options
+):
+    """Get all pages concurrently. The threads share the connection pool of the
+    session. Yield the url and page in the order of the urls."""
+    from requests.adapters import HTTPAdapter
+
+    adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    rate_limiter = (
+        None if requests_per_second is None else RateLimiter(requests_per_second)
+    )
+
+    def get(url):
+        return url, get_with_retries(
+            session, url, rate_limiter=rate_limiter, **retry_options
+        )
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        futures = [executor.submit(get, url) for url in urls]
+        for future in futures:
+            yield future.result()
+
+
 def with_driver(func):
     """Convenience decorator to save one intendation level."""
 
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
+        # Selenium is imported only when a browser is needed, since it slows down
+        # the startup of every script.
+        from selenium import webdriver
+
         options = webdriver.ChromeOptions()
         options.add_argument("--headless")
         with webdriver.Chrome(options=options) as driver:
             return func(driver, *args, **kwargs)
 
     return wrapper
-
-
-def idfy(name: str) -> str:
-    """Replace special characters to match player names from different sources."""
-    replacements = {
-        "ä": "ae",
-        "æ": "ae",
-        "á": "a",
-        "ą": "a",
-        "ć": "c",
-        "č": "c",
-        "ç": "c",
-        "ď": "d",
-        "é": "e",
-        "ę": "e",
-        "ë": "e",
-        "ğ": "g",
-        "ı": "i",
-        "í": "i",
-        "ï": "i",
-        "ł": "l",
-        "ń": "n",
-        "ň": "n",
-        "ñ": "n",
-        "ö": "oe",
-        "ø": "oe",
-        "ó": "o",
-        "ô": "o",
-        "ß": "ss",
-        "š": "s",
-        "ş": "s",
-        "ś": "s",
-        "ü": "ue",
-        "ú": "u",
-        "ý": "y",
-        "ź": "z",
-        "ž": "z",
-    }
-    name_id = name.lower()
-    for replacement in replacements.items():
-        name_id = name_id.replace(*replacement)
-    return name_id
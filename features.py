@@ -0,0 +1,85 @@
+"""Expected points of the players from multiple metrics.
+
+The metrics of all players are joined into a single feature matrix (players x
+metrics). Each metric is scaled to [0, 1] by its maximum, so that the weights are
+comparable. The expected points are the weighted sum of the metrics, i.e. a single
+matrix vector product. Changing the weights requires neither rebuilding the
+matrix nor the model.
+"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+import common
+import instrumentation
+
+# Known metrics. Additional metrics can be given by the metric files.
+METRICS = {
+    "market_value": "Market value of transfermarkt",
+    "rating": "Average rating of the last season, higher is better",
+    "national_appearances": "Appearances in the national team in the last year",
+    "penalty_taker": "1 if the player takes the penalties, else 0",
+}
+
+
+def join_metrics(dataframe, metric_files):
+    """Join the metrics of csv files by the player name. Each file contains the
+    column "name_" and one column per metric. The names of both sides are
+    normalized by "idfy()". Missing values are set to 0. The unmatched players are
+    logged and counted as "unmatched_metrics"."""
+    for metric_file in metric_files:
+        metrics = pd.read_csv(metric_file)
+        metrics["name_id"] = common.idfy_series(metrics.pop("name_"))
+        metrics = metrics.drop_duplicates("name_id")
+        metric_columns = [c for c in metrics.columns if c != "name_id"]
+        name_ids = common.idfy_series(dataframe["name_"])
+        dataframe = (
+            dataframe.drop(columns=metric_columns, errors="ignore")
+            .assign(name_id=name_ids.to_numpy())
+            .merge(metrics, on="name_id", how="left")
+            .drop(columns="name_id")
+        )
+
+        unmatched = dataframe.name_[~name_ids.isin(metrics.name_id).to_numpy()]
+        instrumentation.count("unmatched_metrics", len(unmatched))
+        if len(unmatched) > 0:
+            logging.warning(
+                f"{len(unmatched)} of {len(dataframe)} players have no metrics in "
+                f"{metric_file}, their metrics are set to 0. For example: "
+                f"{unmatched.head(10).tolist()}"
+            )
+            logging.debug(f"Players without metrics: {unmatched.tolist()}")
+        dataframe[metric_columns] = dataframe[metric_columns].fillna(0)
+        logging.info(f"Joined {metric_columns} of {metric_file}.")
+    return dataframe
+
+
+def parse_weights(weights_str):
+    """Parse weights of the form "market_value=1,rating=0.5"."""
+    weights = {}
+    for weight_str in weights_str.split(","):
+        metric, weight = weight_str.split("=", 1)
+        weights[metric.strip()] = float(weight)
+    return weights
+
+
+def feature_matrix(dataframe, metrics):
+    """Return the scaled metrics of all players as float matrix (players x
+    metrics)."""
+    missing = [metric for metric in metrics if metric not in dataframe]
+    if missing:
+        raise ValueError(f"Missing metrics: {missing}")
+    matrix = dataframe[list(metrics)].to_numpy(dtype=float)
+    maximum = np.abs(matrix).max(axis=0, initial=0)
+    return matrix / np.where(maximum > 0, maximum, 1)
+
+
+def expected_points(matrix, metrics, weights):
+    """Weighted sum of the metrics of each player."""
+    unknown = set(weights) - set(metrics)
+    if unknown:
+        raise ValueError(f"Weights of unknown metrics: {sorted(unknown)}")
+    weight_vector = np.array([weights.get(metric, 0.0) for metric in metrics])
+    return matrix @ weight_vector
@@ -0,0 +1,91 @@
+"""Single entry point of all scripts, for example "python ffl.py choose --solver highs".
+
+The module of a command is imported only when the command runs. Thus the help
+and the light commands don't pay for importing pandas, Pyomo or Selenium.
+"""
+
+import argparse
+import importlib
+import sys
+import time
+
+# Command: module and description. Each module has a "main()" function.
+COMMANDS = {
+    "obtain": ("obtain_data", "Obtain the player data."),
+    "choose": ("choose_team", "Choose the best squad."),
+    "eleven": ("starting_eleven", "Choose the starting eleven of a squad."),
+    "sweep": ("sweep", "Evaluate the squad for different rules."),
+    "scenarios": ("scenarios", "Choose the squad over sampled scenarios."),
+    "plan": ("planner", "Plan the squad and the transfers of a season."),
+    "leagues": ("leagues", "Obtain and solve multiple competitions in one job."),
+    "service": ("service", "Run or query the lineup service."),
+    "benchmark": ("benchmark", "Benchmark the critical functions."),
+}
+
+# Packages, which are slow to import.
+HEAVY_PACKAGES = (
+    "bs4",
+    "lxml",
+    "numpy",
+    "pandas",
+    "prettytable",
+    "pyarrow",
+    "pyomo",
+    "requests",
+    "scipy",
+    "selenium",
+)
+
+
+def import_command(module_name, profile=False):
+    """Import the module of a command. Optionally, report the import time and the
+    loaded heavy packages to stderr."""
+    modules_before = set(sys.modules)
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    seconds = time.perf_counter() - start
+
+    if profile:
+        new_modules = set(sys.modules) - modules_before
+        packages = {name.partition(".")[0] for name in new_modules}
+        loaded = [p for p in HEAVY_PACKAGES if p in packages]
+        skipped = [p for p in HEAVY_PACKAGES if p not in sys.modules]
+        print(
+            f"Imported {module_name} in {seconds:.3f} s ({len(new_modules)} modules).\n"
+            f"Loaded: {', '.join(loaded) or '-'}\n"
+            f"Not loaded: {', '.join(skipped) or '-'}\n"
+            'Details: "python -X importtime ffl.py ..."',
+            file=sys.stderr,
+        )
+    return module
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Fantasy football lineup.",
+        epilog="\n".join(
+            f"{command}: {description}"
+            for command, (_, description) in COMMANDS.items()
+        ),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="Report the import time of the command to stderr.",
+    )
+    parser.add_argument("command", choices=COMMANDS)
+    parser.add_argument(
+        "arguments", nargs=argparse.REMAINDER, help="Arguments of the command."
+    )
+    args = parser.parse_args(argv)
+
+    module_name, _ = COMMANDS[args.command]
+    module = import_command(module_name, args.profile_startup)
+    # The commands parse their arguments themselves.
+    sys.argv = [f"{parser.prog} {args.command}", *args.arguments]
+    module.main()
+
+
+if __name__ == "__main__":
+    main()
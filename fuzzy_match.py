@@ -0,0 +1,174 @@
+"""Fuzzy matching of player names from different sources.
+
+Exact matching loses players with slightly different spelling, like "Zabolotny"
+and "Zabolotnyi". The fuzzy matching works in three steps:
+
+1. Blocking: Only players of the same club and with the same first letter of the
+   family name are compared. The clubs of both sources are matched beforehand.
+2. Scoring: The similarity of the names is the cosine similarity of their
+   character bigrams. It is computed as sparse matrix product per block.
+3. Assignment: Each player is matched at most once, such that the total score is
+   maximal.
+"""
+
+import collections
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse import csr_array
+
+import common
+
+# Weight of the family name similarity. The rest is the first initial.
+FAMILY_NAME_WEIGHT = 0.75
+
+
+def split_name(name):
+    """Split a normalized name into first name (may be empty) and family name."""
+    name_parts = name.split(" ", 1)
+    if len(name_parts) == 2:
+        return name_parts[0].rstrip("."), name_parts[1]
+    return "", name_parts[0]
+
+
+def bigram_vectors(strings, vocabulary):
+    """Return the L2 normalized bigram counts of the strings as sparse matrix. The
+    vocabulary is extended by unknown bigrams."""
+    data, indices, indptr = [], [], [0]
+    for string in strings:
+        padded = f" {string} "
+        counts = collections.Counter(
+            padded[position : position + 2] for position in range(len(padded) - 1)
+        )
+        for bigram, count in counts.items():
+            indices.append(vocabulary.setdefault(bigram, len(vocabulary)))
+            data.append(count)
+        indptr.append(len(indices))
+    data = np.array(data, dtype=float)
+    # Normalize each row, so that the dot product is the cosine similarity.
+    lengths = np.diff(indptr)
+    row_norms = np.sqrt(np.add.reduceat(data**2, indptr[:-1])) if len(data) else []
+    data /= np.repeat(row_norms, lengths)
+    return data, indices, indptr
+
+
+def to_matrix(vectors, width):
+    data, indices, indptr = vectors
+    return csr_array((data, indices, indptr), shape=(len(indptr) - 1, width))
+
+
+def similarity_matrices(left_strings, right_strings):
+    """Return the bigram vectors of both sides with a common vocabulary."""
+    vocabulary = {}
+    left = bigram_vectors(left_strings, vocabulary)
+    right = bigram_vectors(right_strings, vocabulary)
+    return to_matrix(left, len(vocabulary)), to_matrix(right, len(vocabulary))
+
+
+def assign(scores, min_score):
+    """One-to-one assignment with maximal total score. Return the row and column
+    indices of the assigned pairs with at least "min_score"."""
+    rows, columns = linear_sum_assignment(scores, maximize=True)
+    valid = scores[rows, columns] >= min_score
+    return rows[valid], columns[valid]
+
+
+def match_clubs(left_clubs, right_clubs):
+    """Map the clubs of the left source to the clubs of the right source."""
+    left_clubs = sorted(set(left_clubs))
+    right_clubs = sorted(set(right_clubs))
+
+    def normalize(club):
+        return common.idfy(club).replace("-", " ")
+
+    left, right = similarity_matrices(
+        [normalize(c) for c in left_clubs], [normalize(c) for c in right_clubs]
+    )
+    rows, columns = assign((left @ right.T).toarray(), min_score=0.3)
+    return {left_clubs[row]: right_clubs[column] for row, column in zip(rows, columns)}
+
+
+def match_players(left, right, left_club=None, right_club=None, min_score=0.6):
+    """Match the players of two dataframes by the "name_" column. If the club
+    columns are given, only players of matching clubs are compared.
+
+    Return a dataframe with the columns "left", "right" (index of the matched
+    rows) and "score" (confidence between 0 and 1).
+    """
+    left_names = [split_name(common.idfy(name)) for name in left.name_]
+    right_names = [split_name(common.idfy(name)) for name in right.name_]
+    left_family, right_family = similarity_matrices(
+        [family for _, family in left_names], [family for _, family in right_names]
+    )
+    left_initials = np.array([first[:1] for first, _ in left_names])
+    right_initials = np.array([first[:1] for first, _ in right_names])
+
+    # Blocking by club and first letter of the family name.
+    if left_club is not None and right_club is not None:
+        club_mapping = match_clubs(left[left_club], right[right_club])
+        left_blocks = [club_mapping.get(club) for club in left[left_club]]
+        right_blocks = list(right[right_club])
+    else:
+        left_blocks = [None] * len(left)
+        right_blocks = [None] * len(right)
+    blocks = collections.defaultdict(lambda: ([], []))
+    for position, (block, (_, family)) in enumerate(zip(left_blocks, left_names)):
+        blocks[(block, family[:1])][0].append(position)
+    for position, (block, (_, family)) in enumerate(zip(right_blocks, right_names)):
+        blocks[(block, family[:1])][1].append(position)
+
+    matches = []
+    for left_positions, right_positions in blocks.values():
+        if not left_positions or not right_positions:
+            continue
+        family_scores = (
+            left_family[left_positions] @ right_family[right_positions].T
+        ).toarray()
+        # Missing first names (like "Danilo") are compatible to every first name.
+        left_block_initials = left_initials[left_positions][:, None]
+        right_block_initials = right_initials[right_positions][None, :]
+        initial_scores = (
+            (left_block_initials == right_block_initials)
+            | (left_block_initials == "")
+            | (right_block_initials == "")
+        )
+        scores = (
+            FAMILY_NAME_WEIGHT * family_scores
+            + (1 - FAMILY_NAME_WEIGHT) * initial_scores
+        )
+        rows, columns = assign(scores, min_score)
+        for row, column in zip(rows, columns):
+            matches.append(
+                (left_positions[row], right_positions[column], scores[row, column])
+            )
+
+    matches = pd.DataFrame(matches, columns=["left", "right", "score"])
+    matches["left"] = left.index[matches.left.to_numpy(dtype=int)]
+    matches["right"] = right.index[matches.right.to_numpy(dtype=int)]
+    return matches.sort_values("left", ignore_index=True)
+
+
+def merge(left, right, review_file=None, review_score=0.9, **match_options):
+    """Merge two dataframes of players by fuzzy matching of the names. The columns
+    of the left dataframe take precedence. Matches with a score below
+    "review_score" are written to the review file."""
+    matches = match_players(left, right, **match_options)
+
+    if review_file is not None:
+        review = matches[matches.score < review_score]
+        pd.DataFrame(
+            {
+                "name_left": left.name_.loc[review.left].to_numpy(),
+                "name_right": right.name_.loc[review.right].to_numpy(),
+                "score": review.score.round(3).to_numpy(),
+            }
+        ).sort_values("score").to_csv(review_file, index=False)
+
+    right_columns = [c for c in right.columns if c not in left.columns]
+    merged = left.loc[matches.left].reset_index(drop=True)
+    merged[right_columns] = right.loc[matches.right, right_columns].reset_index(
+        drop=True
+    )
+    merged["match_score"] = matches.score.to_numpy()
+    return merged
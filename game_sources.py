@@ -0,0 +1,317 @@
+"""Sources of the available players of the manager games.
+
+Each game provides its player list as bulk download (CSV or JSON API), which needs
+only a single request. Scraping the game website with a browser is slow and
+fragile. It is only used as fallback, if the bulk download fails.
+
+All sources return a dataframe with at least the columns "name_", "cost_ingame"
+(in €) and "position" (name of "common.Position"). The column "club" is optional.
+"""
+
+from dataclasses import dataclass
+import io
+import json
+import logging
+import time
+
+import pandas as pd
+import requests
+
+import common
+import instrumentation
+import store
+
+
+class GameSource:
+    """Interface of all game sources."""
+
+    name = None
+    # Whether the website can be scraped, if the bulk download fails.
+    has_fallback = False
+
+    def __init__(self, season=store.CURRENT_SEASON):
+        # First year of the season. Not every game supports multiple seasons.
+        self.season = season
+
+    def fetch(self, fallback=True) -> pd.DataFrame:
+        """Obtain the available players by the bulk download. Use the fallback
+        only if the bulk download fails."""
+        try:
+            with common.create_session() as session:
+                players = self.fetch_bulk(session)
+            instrumentation.count("rows_parsed", len(players))
+        except (requests.RequestException, ValueError, KeyError) as error:
+            if not (fallback and self.has_fallback):
+                raise
+            logging.warning(f"Bulk download of {self.name} failed: {error=}.")
+            players = self.fetch_fallback()
+        logging.info(f"{len(players)} available players of {self.name}.")
+        return players
+
+    def fetch_bulk(self, session) -> pd.DataFrame:
+        page = session.get(self.bulk_url())
+        page.raise_for_status()
+        return self.parse_bulk(page.content)
+
+    def bulk_url(self) -> str:
+        raise NotImplementedError
+
+    def parse_bulk(self, content) -> pd.DataFrame:
+        """Parse the bulk download. Recorded downloads can be parsed offline."""
+        raise NotImplementedError
+
+    def fetch_fallback(self) -> pd.DataFrame:
+        raise NotImplementedError
+
+
+class KickerSource(GameSource):
+    """Kicker Managerspiel Interactive. The player list is a CSV file."""
+
+    name = "kicker"
+    url = "https://www.kicker-libero.de/api/sportsdata/v1/players-details/se-k0001{season}.csv"
+    columns = {
+        "Angezeigter Name": "name_",
+        "Marktwert": "cost_ingame",
+        "Position": "position",
+        "Verein": "club",
+    }
+
+    def bulk_url(self):
+        return self.url.format(season=self.season)
+
+    def parse_bulk(self, content):
+        players = pd.read_csv(io.BytesIO(content), delimiter=";")
+        return players.rename(columns=self.columns)
+
+
+class KickerSecondLeagueSource(KickerSource):
+    """Kicker Managerspiel Interactive of the 2. Bundesliga."""
+
+    name = "kicker-2"
+    url = "https://www.kicker-libero.de/api/sportsdata/v1/players-details/se-k0002{season}.csv"
+
+
+class KickerEmSource(KickerSource):
+    """Kicker Managerspiel Interactive of the European Championship. The season is
+    the year of the tournament."""
+
+    name = "kicker-em"
+    url = "https://www.kicker-libero.de/api/sportsdata/v1/players-details/se-k0107{season}.csv"
+
+
+class UefaSource(GameSource):
+    """UEFA fantasy football. The player list is a JSON feed. The website can be
+    scraped as fallback."""
+
+    name = "uefa"
+    has_fallback = True
+    # Game of each season. Other seasons are refused, since their feeds are unknown.
+    games = {"2020": "uefaeuro2020fantasyfootball"}
+    url = (
+        "https://gaming.uefa.com/en/{game}/services/feeds/players/players_70_de_1.json"
+    )
+    fallback_url = "https://gaming.uefa.com/de/{game}/create-team"
+    # Positions are encoded by their "skill" in the feed.
+    positions = {
+        1: common.Position.GOALKEEPER.name,
+        2: common.Position.DEFENDER.name,
+        3: common.Position.MIDFIELDER.name,
+        4: common.Position.FORWARD.name,
+    }
+
+    def __init__(self, season=store.CURRENT_SEASON):
+        season = str(season)
+        if season not in self.games:
+            raise ValueError(
+                f"No UEFA game known for the season {season}. "
+                f"Known seasons: {', '.join(self.games)}."
+            )
+        super().__init__(season)
+        self.game = self.games[season]
+
+    def bulk_url(self):
+        return self.url.format(game=self.game)
+
+    def parse_bulk(self, content):
+        players = pd.DataFrame(json.loads(content)["data"]["value"]["playerList"])
+        return pd.DataFrame(
+            {
+                "name_": players["pDName"],
+                # The values are given in Mio. €.
+                "cost_ingame": (players["value"] * 10**6).round().astype("int64"),
+                "position": players["skill"].map(self.positions),
+                "club": players["tName"],
+            }
+        )
+
+    def fetch_fallback(self):
+        players = common.players_to_dataframe(
+            get_available_players_fantasy(self.fallback_url.format(game=self.game))
+        )
+        return pd.DataFrame(
+            {
+                "name_": players["name"],
+                "cost_ingame": players["ingame_value"],
+                "position": players["ingame_position"].astype(str),
+            }
+        )
+
+
+GAME_SOURCES = {
+    source.name: source
+    for source in (
+        KickerSource,
+        KickerSecondLeagueSource,
+        KickerEmSource,
+        UefaSource,
+    )
+}
+
+
+def get_source(name, **options) -> GameSource:
+    return GAME_SOURCES[name](**options)
+
+
+# Read the visible rows of a virtualized table and scroll by one page afterwards.
+# Everything happens in a single round trip. The script waits for the next frame,
+# so that the rows of the previous scroll step are rendered.
+HARVEST_SCRIPT = """
+const [rowGroup, done] = [arguments[0], arguments[arguments.length - 1]];
+const text = (element, selector) => {
+    const child = element.querySelector(selector);
+    return child === null ? "" : child.textContent.trim();
+};
+requestAnimationFrame(() => requestAnimationFrame(() => {
+    const rows = Array.from(rowGroup.querySelectorAll(":scope > div"), (row) => {
+        const currency = row.querySelectorAll(".si-currency span");
+        return {
+            name: text(row, ".si-plyr-name"),
+            position: text(row, ".si-pos"),
+            currency: currency.length === 2 ? currency[0].textContent.trim() : "",
+            value: currency.length === 2 ? currency[1].textContent.trim() : "",
+        };
+    });
+
+    let container = rowGroup;
+    while (container !== null && container.scrollHeight <= container.clientHeight) {
+        container = container.parentElement;
+    }
+    container = container || document.scrollingElement;
+    // Keep one row of overlap to verify that no rows were skipped.
+    const rowHeight = rowGroup.firstElementChild?.offsetHeight || 0;
+    const pageSize = Math.max(container.clientHeight - rowHeight, 1);
+    const before = container.scrollTop;
+    container.scrollTop = before + pageSize;
+    done({rows: rows, page_size: pageSize, scrolled: container.scrollTop !== before});
+}));
+"""
+
+
+@dataclass
+class HarvestStatistics:
+    """Counters of a table harvest."""
+
+    round_trips: int = 0
+    rows_seen: int = 0
+    rows_new: int = 0
+    seconds: float = 0.0
+
+    def rows_per_second(self):
+        return self.rows_new / self.seconds if self.seconds else 0.0
+
+
+def harvest_table(driver, row_group, row_key, max_round_trips=10_000):
+    """Collect all rows of a virtualized table, which renders only the visible rows.
+    Each step reads the visible rows and scrolls one page down by a single script.
+    Rows with an already seen key are skipped. Return the rows in order of their
+    first appearance and the statistics."""
+    statistics = HarvestStatistics()
+    start = time.perf_counter()
+
+    rows = {}
+    last_keys = None
+    while statistics.round_trips < max_round_trips:
+        batch = driver.execute_async_script(HARVEST_SCRIPT, row_group)
+        statistics.round_trips += 1
+        statistics.rows_seen += len(batch["rows"])
+
+        keys = set()
+        for row in batch["rows"]:
+            key = row_key(row)
+            keys.add(key)
+            if key not in rows:
+                rows[key] = row
+                statistics.rows_new += 1
+        if last_keys is not None and keys and not (last_keys & keys):
+            raise Exception("Scrolling failed. Common rows are required.")
+        last_keys = keys
+        logging.debug(f"{len(rows)} rows, page size {batch['page_size']} px.")
+
+        if not batch["scrolled"]:
+            break
+    else:
+        logging.warning(f"Stopped harvesting after {max_round_trips} round trips.")
+
+    statistics.seconds = time.perf_counter() - start
+    instrumentation.count("round_trips", statistics.round_trips)
+    instrumentation.count("rows_parsed", statistics.rows_new)
+    logging.info(
+        f"Harvested {len(rows)} rows in {statistics.round_trips} round trips "
+        f"({statistics.rows_per_second():.1f} rows/s)."
+    )
+    return list(rows.values()), statistics
+
+
+def parse_ingame_value(ingame_value_str) -> int:
+    ingame_value = float(ingame_value_str[:-1])
+    value_prefix = ingame_value_str[-1]
+
+    if value_prefix == "M":
+        ingame_value *= 10**6
+    else:
+        raise ValueError(f"Invalid prefix: {value_prefix}")
+
+    return int(ingame_value)
+
+
+@common.with_driver
+def get_available_players_fantasy(driver, url):
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    driver.get(url)
+
+    # wait until page is fully loaded
+    player_filter = WebDriverWait(driver, 10).until(
+        EC.presence_of_element_located((By.ID, "PlayreFilters"))
+    )
+    player_table = player_filter.find_element(By.CSS_SELECTOR, "div[role='rowgroup']")
+
+    # accept all cookies
+    driver.find_element(By.ID, "onetrust-accept-btn-handler").click()
+
+    rows, _ = harvest_table(
+        driver,
+        player_table,
+        row_key=lambda row: (row["name"], row["position"], row["value"]),
+    )
+
+    player_data = set()
+    for row in rows:
+        if row["currency"] != "€":
+            logging.warning(f"Invalid currency {row['currency']}. Skipping.")
+            continue
+        if row["name"] and row["position"] and row["value"]:
+            player_data.add(
+                common.Player(
+                    name=row["name"],
+                    ingame_position=common.Position[row["position"]],
+                    ingame_value=parse_ingame_value(row["value"]),
+                )
+            )
+        else:
+            logging.warning(
+                f"Empty string: {row['name']}, {row['position']}, {row['value']}. Skipping."
+            )
+    return player_data
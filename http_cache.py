@@ -0,0 +1,210 @@
+"""On-disk HTTP cache for GET requests.
+
+The bodies are stored by url. Fresh entries are served without request. Stale
+entries are revalidated by "If-None-Match" and "If-Modified-Since", so unchanged
+pages cost only a "304 Not Modified". The cache size is bounded by evicting the
+least recently used entries.
+
+The access times of the entries are kept in memory and written to the index only
+by "flush()", at the latest when the process exits. Thus cache hits don't write
+any file.
+"""
+
+import atexit
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+class HttpCache:
+    def __init__(
+        self, directory, max_size=256 * 2**20, ttls=None, default_ttl=0, refresh=False
+    ):
+        """
+        :param max_size: Maximum size of all bodies in bytes.
+        :param ttls: Time to live in seconds per host. Entries within their time
+            to live are used without request.
+        :param refresh: Revalidate all entries, regardless of their time to live.
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.ttls = {} if ttls is None else ttls
+        self.default_ttl = default_ttl
+        self.refresh = refresh
+
+        self.hits = 0  # served from cache without request
+        self.revalidations = 0  # served from cache after "304 Not Modified"
+        self.misses = 0  # downloaded
+
+        self.lock = threading.Lock()
+        # Serializes writing the index file. It is written outside of "lock".
+        self.index_lock = threading.Lock()
+        self.index_changed = False
+        os.makedirs(directory, exist_ok=True)
+        self.index_file = os.path.join(directory, "index.json")
+        try:
+            with open(self.index_file) as infile:
+                self.index = json.load(infile)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.index = {}
+        self._evict()
+        atexit.register(self.flush)
+
+    def _body_file(self, url):
+        return os.path.join(
+            self.directory, hashlib.sha256(url.encode()).hexdigest() + ".body"
+        )
+
+    def flush(self):
+        """Write the index, if it changed. The file is replaced atomically."""
+        with self.lock:
+            if not self.index_changed:
+                return
+            index = json.dumps(self.index)
+            self.index_changed = False
+        with self.index_lock:
+            temporary_file = self.index_file + ".tmp"
+            with open(temporary_file, "w") as outfile:
+                outfile.write(index)
+            os.replace(temporary_file, self.index_file)
+
+    def is_fresh(self, entry):
+        if self.refresh:
+            return False
+        ttl = self.ttls.get(urlparse(entry["url"]).netloc, self.default_ttl)
+        return time.time() - entry["validated"] < ttl
+
+    def lookup(self, url):
+        """Return the index entry of the url or None."""
+        with self.lock:
+            entry = self.index.get(url)
+            if entry is not None and not os.path.isfile(self._body_file(url)):
+                del self.index[url]
+                self.index_changed = True
+                return None
+            return entry
+
+    def response(self, url):
+        """Create a response from the cached body and mark it as used. Return None
+        if the entry got evicted meanwhile."""
+        with self.lock:
+            entry = self.index.get(url)
+            if entry is None:
+                return None
+            entry["accessed"] = time.time()
+            self.index_changed = True
+            with open(self._body_file(url), "rb") as infile:
+                content = infile.read()
+
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response.encoding = entry["encoding"]
+        response._content = content
+        return response
+
+    def revalidated(self, url):
+        with self.lock:
+            if url in self.index:
+                self.index[url]["validated"] = time.time()
+                self.index_changed = True
+            self.revalidations += 1
+
+    def store(self, url, response):
+        now = time.time()
+        headers = {
+            key: response.headers[key]
+            for key in ("Content-Type", "ETag", "Last-Modified")
+            if key in response.headers
+        }
+        with self.lock:
+            with open(self._body_file(url), "wb") as outfile:
+                outfile.write(response.content)
+            self.index[url] = {
+                "url": url,
+                "headers": headers,
+                "encoding": response.encoding,
+                "size": len(response.content),
+                "validated": now,
+                "accessed": now,
+            }
+            self.index_changed = True
+            self._evict()
+        # New entries are written immediately. Downloads are slow anyway.
+        self.flush()
+
+    def _evict(self):
+        """Remove the least recently used entries until the size limit is met."""
+        evicted = False
+        total_size = sum(entry["size"] for entry in self.index.values())
+        for url, entry in sorted(self.index.items(), key=lambda e: e[1]["accessed"]):
+            if total_size <= self.max_size:
+                break
+            logging.debug(f"Evict {url} from HTTP cache.")
+            total_size -= entry["size"]
+            del self.index[url]
+            evicted = True
+            try:
+                os.remove(self._body_file(url))
+            except FileNotFoundError:
+                pass
+        if evicted:
+            self.index_changed = True
+
+    def statistics(self):
+        return {
+            "hits": self.hits,
+            "revalidations": self.revalidations,
+            "misses": self.misses,
+        }
+
+
+class CachedSession(requests.Session):
+    """Session, which answers GET requests from the HTTP cache if possible."""
+
+    def __init__(self, cache):
+        super().__init__()
+        self.cache = cache
+
+    def request(self, method, url, *args, headers=None, **kwargs):
+        if method.upper() != "GET":
+            return super().request(method, url, *args, headers=headers, **kwargs)
+
+        # The cache key is the url including the encoded query parameters.
+        key = requests.Request(method, url, params=kwargs.get("params")).prepare().url
+        entry = self.cache.lookup(key)
+        if entry is not None:
+            response = self.cache.response(key) if self.cache.is_fresh(entry) else None
+            if response is not None:
+                with self.cache.lock:
+                    self.cache.hits += 1
+                return response
+
+            headers = dict(headers or {})
+            if "ETag" in entry["headers"]:
+                headers["If-None-Match"] = entry["headers"]["ETag"]
+            if "Last-Modified" in entry["headers"]:
+                headers["If-Modified-Since"] = entry["headers"]["Last-Modified"]
+
+        response = super().request(method, url, *args, headers=headers, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            self.cache.revalidated(key)
+            cached_response = self.cache.response(key)
+            if cached_response is not None:
+                return cached_response
+            # Evicted meanwhile. Download again.
+            response = super().request(method, url, *args, **kwargs)
+
+        with self.cache.lock:
+            self.cache.misses += 1
+        if response.status_code == 200:
+            self.cache.store(key, response)
+        return response
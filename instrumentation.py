@@ -0,0 +1,125 @@
+"""Timers and counters of the pipeline stages.
+
+A stage is a named step of a script, for example "transfermarkt", "match" or
+"solve". Each stage records its calls, its wall time and arbitrary counters like
+requests, bytes or parsed rows. Counters are added to the innermost running stage,
+also from the worker threads of the stage. The statistics can be exported as JSON
+to compare runs.
+
+Single stages can be profiled by cProfile. The profile is written to
+"<profile_directory>/<stage>.prof" and can be inspected by "python -m pstats".
+"""
+
+import contextlib
+import cProfile
+import json
+import logging
+from pathlib import Path
+import threading
+import time
+
+# Counters outside of any stage.
+NO_STAGE = "other"
+
+
+class Statistics:
+    """Statistics of all stages. Thread safe."""
+
+    def __init__(self, profile_stages=(), profile_directory="work/profiles"):
+        self.stages = {}
+        # Stages to profile. "all" profiles every outermost stage.
+        self.profile_stages = set(profile_stages)
+        self.profile_directory = Path(profile_directory)
+        self._running = []
+        self._profilers = {}
+        self._profiling = False
+        self._lock = threading.Lock()
+
+    def _entry(self, name):
+        return self.stages.setdefault(name, {"calls": 0, "seconds": 0.0})
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time the enclosed code as stage "name". Multiple calls accumulate."""
+        profiler = None
+        with self._lock:
+            self._running.append(name)
+            # Only one profiler can be active at the same time.
+            if not self._profiling and (
+                name in self.profile_stages or "all" in self.profile_stages
+            ):
+                # The profile accumulates over multiple calls of the stage.
+                profiler = self._profilers.setdefault(name, cProfile.Profile())
+                self._profiling = True
+
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            seconds = time.perf_counter() - start
+            with self._lock:
+                # Remove the last occurrence. Other threads may have started
+                # stages in the meantime.
+                del self._running[
+                    len(self._running) - 1 - self._running[::-1].index(name)
+                ]
+                entry = self._entry(name)
+                entry["calls"] += 1
+                entry["seconds"] += seconds
+                if profiler is not None:
+                    self._profiling = False
+            if profiler is not None:
+                self.profile_directory.mkdir(parents=True, exist_ok=True)
+                profile_file = self.profile_directory / f"{name}.prof"
+                profiler.dump_stats(profile_file)
+                logging.info(f"Profile of {name} written to {profile_file}.")
+
+    def count(self, counter, value=1):
+        """Add the value to a counter of the innermost running stage."""
+        with self._lock:
+            entry = self._entry(self._running[-1] if self._running else NO_STAGE)
+            entry[counter] = entry.get(counter, 0) + value
+
+    def to_dict(self):
+        with self._lock:
+            return {name: dict(entry) for name, entry in self.stages.items()}
+
+    def write_json(self, file_):
+        Path(file_).write_text(json.dumps({"stages": self.to_dict()}, indent=2))
+
+    def summary(self):
+        """Return one line per stage."""
+        lines = []
+        for name, entry in self.to_dict().items():
+            counters = ", ".join(
+                f"{counter}={value}"
+                for counter, value in entry.items()
+                if counter not in ("calls", "seconds")
+            )
+            lines.append(
+                f"{name}: {entry['seconds']:.3f} s, {entry['calls']} calls"
+                + (f", {counters}" if counters else "")
+            )
+        return "\n".join(lines)
+
+
+# Statistics of the current process.
+statistics = Statistics()
+
+
+def stage(name):
+    return statistics.stage(name)
+
+
+def count(counter, value=1):
+    statistics.count(counter, value)
+
+
+def count_response(response, *args, **kwargs):
+    """Response hook of requests. Count the requests and the received bytes."""
+    statistics.count("requests")
+    statistics.count("bytes", len(response.content))
@@ -0,0 +1,264 @@
+"""Lineups of multiple competitions in one job.
+
+The data of all competitions is obtained in parallel threads, since it is mostly
+waiting for the network. Each competition is written to its own partition of the
+player pool. Then the lineup of each competition is solved with the rules of the
+competition in a process pool. Each worker reads only the partition of its
+competition. The wall time is about that of the slowest competition.
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+import functools
+import logging
+import os
+import time
+from typing import Callable, Optional
+
+import pyomo.environ as pyomo_env
+
+import choose_team
+import common
+import game_sources
+import obtain_data
+import solvers
+import store
+import sweep
+
+
+def default_rules(**rules):
+    """Rules of the game in the format of "sweep.set_parameters()". Default: The
+    rules of "choose_team"."""
+    return {
+        "budget": choose_team.MAXIMUM_INGAME_VALUE / 10**6,
+        "formation": dict(choose_team.EXPECTED_POSITION_COUNTS),
+        "nation_min": choose_team.PLAYERS_PER_NATION[0],
+        "nation_max": choose_team.PLAYERS_PER_NATION[1],
+        **rules,
+    }
+
+
+@dataclass(frozen=True)
+class Competition:
+    name: str
+    # Obtain the market values of a season.
+    fetch_transfermarkt: Callable
+    # Name of the game source.
+    game: str
+    rules: dict = field(default_factory=default_rules)
+    # Season of a tournament. None: The season of the job.
+    season: Optional[str] = None
+
+
+COMPETITIONS = {
+    competition.name: competition
+    for competition in (
+        Competition(
+            "bundesliga", obtain_data.get_data_from_transfermarkt_bundesliga, "kicker"
+        ),
+        Competition(
+            "2-bundesliga",
+            obtain_data.get_data_from_transfermarkt_2_bundesliga,
+            "kicker-2",
+        ),
+        # The Kicker EM game has the same rules as the Bundesliga game.
+        Competition(
+            "em-2024",
+            obtain_data.get_data_from_transfermarkt_em_2024,
+            "kicker-em",
+            season="2024",
+        ),
+    )
+}
+
+
+def ingest(
+    competition, season, force=False, matcher="exact", fallback=True, **fetch_options
+):
+    """Obtain the players of a competition and write them to the pool. Return the
+    number of players."""
+    season = competition.season or season
+    # Fails early for seasons without known game.
+    game_source = game_sources.get_source(competition.game, season=season)
+    player_data_transfermarkt = store.get(
+        store.ROOT,
+        f"transfermarkt_{competition.name}",
+        season,
+        store.TRANSFERMARKT_SCHEMA,
+        functools.partial(
+            competition.fetch_transfermarkt, season=season, **fetch_options
+        ),
+        force,
+    )
+    player_data_game = game_source.fetch(fallback=fallback)
+    player_data = obtain_data.merge_sources(
+        player_data_game,
+        player_data_transfermarkt,
+        matcher,
+        review_file=f"work/match_review_{competition.name}.csv",
+    )
+    store.write_pool(
+        store.POOL_ROOT,
+        competition.name,
+        season,
+        player_data[store.PLAYERS_SCHEMA.names],
+    )
+    logging.info(f"{len(player_data)} players of {competition.name}.")
+    return len(player_data)
+
+
+def ingest_all(competitions, season, **options):
+    """Obtain all competitions in parallel. A failing competition doesn't stop the
+    others. Return the number of players of each successful competition."""
+    players = {}
+    with ThreadPoolExecutor(len(competitions)) as executor:
+        futures = {
+            competition.name: executor.submit(ingest, competition, season, **options)
+            for competition in competitions
+        }
+        for name, future in futures.items():
+            try:
+                players[name] = future.result()
+            except Exception:
+                logging.exception(f"Obtaining {name} failed.")
+    return players
+
+
+def solve_competition(name, season, solver="highs", solver_options=None):
+    """Solve the lineup of a competition with its rules. Return the result and the
+    chosen players."""
+    season = COMPETITIONS[name].season or season
+    dataframe = store.read_pool(
+        store.POOL_ROOT,
+        competitions=[name],
+        seasons=[season],
+        columns=store.PLAYERS_SCHEMA.names,
+    )
+    if dataframe is None or dataframe.empty:
+        raise ValueError(f"No players of {name} in the pool.")
+
+    model = choose_team.create_model_vectorized(dataframe)
+    sweep.set_parameters(model, COMPETITIONS[name].rules)
+    backend = solvers.get_backend(solver, **(solver_options or {}))
+    result = backend.solve(model)
+    chosen = [pyomo_env.value(model.chosen[i]) > 0.5 for i in model.name_]
+    team = dataframe[chosen] if result.optimal else dataframe.iloc[:0]
+    return result, team[store.PLAYERS_SCHEMA.names]
+
+
+def solve_all(names, season, solver="highs", solver_options=None, processes=None):
+    """Solve the competitions in a process pool. Return the result and the chosen
+    players of each successful competition."""
+    processes = min(processes or os.cpu_count() or 1, len(names))
+    solutions = {}
+    with ProcessPoolExecutor(processes) as executor:
+        futures = {
+            name: executor.submit(
+                solve_competition, name, season, solver, solver_options
+            )
+            for name in names
+        }
+        for name, future in futures.items():
+            try:
+                solutions[name] = future.result()
+            except Exception:
+                logging.exception(f"Solving {name} failed.")
+    return solutions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--competitions",
+        default="bundesliga,2-bundesliga",
+        help=f"Comma separated competitions. Available: {', '.join(COMPETITIONS)}.",
+    )
+    parser.add_argument(
+        "--season",
+        default=store.CURRENT_SEASON,
+        help="First year of the season, for example 2025 for the season 2025/26.",
+    )
+    parser.add_argument(
+        "--skip-obtain",
+        action="store_true",
+        help="Solve the competitions of the existing pool without obtaining them.",
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Force refreshing of the cache."
+    )
+    parser.add_argument(
+        "--concurrency",
+        default=8,
+        type=int,
+        help="Number of concurrent requests per competition.",
+    )
+    parser.add_argument(
+        "--requests-per-second",
+        default=None,
+        type=float,
+        help="Maximum number of requests per second and host.",
+    )
+    parser.add_argument("--matcher", choices=("exact", "fuzzy"), default="exact")
+    parser.add_argument(
+        "--no-browser-fallback",
+        action="store_true",
+        help="Don't scrape the game website, if the bulk download fails.",
+    )
+    parser.add_argument(
+        "--solver",
+        choices=solvers.BACKENDS.keys(),
+        default="highs",
+        help="Solver backend. native supports only competitions without nation limit.",
+    )
+    parser.add_argument(
+        "--processes",
+        default=None,
+        type=int,
+        help="Number of worker processes. Default is the number of CPUs.",
+    )
+    args = parser.parse_args()
+
+    names = args.competitions.split(",")
+    unknown = set(names) - set(COMPETITIONS)
+    if unknown:
+        parser.error(f"Unknown competitions: {sorted(unknown)}")
+
+    obtain_data.setup_logging()
+    if not args.skip_obtain:
+        obtain_data.setup_http_cache(refresh=args.force)
+        start = time.perf_counter()
+        players = ingest_all(
+            [COMPETITIONS[name] for name in names],
+            args.season,
+            force=args.force,
+            matcher=args.matcher,
+            fallback=not args.no_browser_fallback,
+            concurrency=args.concurrency,
+            requests_per_second=args.requests_per_second,
+        )
+        common.http_cache.flush()
+        print(f"Obtained {players} in {time.perf_counter() - start:.3f} s.")
+        names = [name for name in names if name in players]
+
+    start = time.perf_counter()
+    solutions = solve_all(names, args.season, args.solver, processes=args.processes)
+    for name, (result, team) in solutions.items():
+        print(f"{name}:")
+        if result.optimal:
+            print(team.sort_values(["position", "name_"]).to_string(index=False))
+            print(
+                f"Ingame value: {team.cost_ingame.sum() / 10**6:.1f} Mio. €, "
+                f"market value: {team.market_value.sum() / 10**6:.2f} Mio. €"
+            )
+        else:
+            print("No optimal lineup found.")
+        print(f"Solved with {result.backend} in {result.wall_time:.3f} s.")
+    print(
+        f"Solved {len(solutions)} of {len(names)} competitions in "
+        f"{time.perf_counter() - start:.3f} s."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Exact lineup solver without external solver.
+
+The lineup problem is a knapsack with a fixed amount of players per position. It
+is solved by dynamic programming over the budget:
+
+1. For each position, find the best value for each exact cost of the required
+   amount of players.
+2. Merge the positions by finding the best split of the budget.
+
+The costs have to be multiples of "cost_step". With a budget of 42.5 Mio. and a
+step of 0.1 Mio., there are only 426 possible costs.
+"""
+
+import heapq
+
+import numpy as np
+
+
+class InfeasibleError(ValueError):
+    """No lineup fits into the budget or there are too few players of a group."""
+
+
+def prune_dominated(values, costs, count):
+    """Return the indices of all players, which aren't dominated by at least "count"
+    other players. A dominated player is never required for an optimal lineup,
+    since one of the dominating players is always available as replacement."""
+    order = np.lexsort((-values, costs))  # ascending cost, descending value
+    best_values = []  # min-heap of the "count" best values seen so far
+    kept = []
+    for index in order.tolist():
+        value = values[index]
+        if len(best_values) == count:
+            if best_values[0] >= value:
+                continue
+            heapq.heapreplace(best_values, value)
+        else:
+            heapq.heappush(best_values, value)
+        kept.append(index)
+    return np.array(sorted(kept), dtype=int)
+
+
+def solve_group(values, costs, count, budget):
+    """Solve the knapsack for a single position.
+
+    Return the best value of exactly "count" players for each total cost and a
+    function to restore the chosen players for a given total cost.
+    """
+    best = np.full((count + 1, budget + 1), -np.inf)
+    best[0, 0] = 0.0
+    improved = np.zeros((len(values), count + 1, budget + 1), dtype=bool)
+
+    for player, (value, cost) in enumerate(zip(values.tolist(), costs.tolist())):
+        if cost > budget:
+            continue
+        # Take the player as the k-th player. The right hand side is evaluated
+        # before assignment, so each player is taken at most once.
+        candidate = best[:-1, : budget + 1 - cost] + value
+        better = candidate > best[1:, cost:]
+        best[1:, cost:] = np.where(better, candidate, best[1:, cost:])
+        improved[player, 1:, cost:] = better
+
+    def restore(total_cost):
+        chosen = []
+        remaining = count
+        for player in range(len(values) - 1, -1, -1):
+            if remaining == 0:
+                break
+            if improved[player, remaining, total_cost]:
+                chosen.append(player)
+                remaining -= 1
+                total_cost -= costs[player]
+        return chosen
+
+    return best[count], restore
+
+
+def solve_knapsack(values, costs, groups, group_counts, budget):
+    """Choose exactly "group_counts[group]" players of each group, such that the
+    total cost doesn't exceed the budget and the total value is maximal.
+
+    All costs and the budget have to be integers. Return the indices of the
+    chosen players.
+    """
+    if budget < 0:
+        raise InfeasibleError("No lineup fits into the budget.")
+    values = np.asarray(values, dtype=float)
+    costs = np.asarray(costs, dtype=int)
+    groups = np.asarray(groups)
+
+    # Best value per total cost of all merged groups so far.
+    combined = np.full(budget + 1, -np.inf)
+    combined[0] = 0.0
+    merge_steps = []
+    for group, count in group_counts.items():
+        candidates = np.flatnonzero(groups == group)
+        candidates = candidates[
+            prune_dominated(values[candidates], costs[candidates], count)
+        ]
+        group_best, restore = solve_group(
+            values[candidates], costs[candidates], count, budget
+        )
+
+        merged = np.full(budget + 1, -np.inf)
+        split = np.zeros(budget + 1, dtype=int)  # cost of the current group
+        for group_cost in np.flatnonzero(np.isfinite(group_best)).tolist():
+            candidate = combined[: budget + 1 - group_cost] + group_best[group_cost]
+            better = candidate > merged[group_cost:]
+            merged[group_cost:] = np.where(better, candidate, merged[group_cost:])
+            split[group_cost:] = np.where(better, group_cost, split[group_cost:])
+        combined = merged
+        merge_steps.append((candidates, restore, split))
+
+    if not np.isfinite(combined).any():
+        raise InfeasibleError("No lineup fits into the budget.")
+
+    chosen = []
+    total_cost = int(np.argmax(combined))
+    for candidates, restore, split in reversed(merge_steps):
+        group_cost = int(split[total_cost])
+        chosen.extend(candidates[restore(group_cost)].tolist())
+        total_cost -= group_cost
+    return sorted(chosen)
+
+
+def solve_lineup(
+    dataframe, expected_position_counts, maximum_ingame_value, cost_step=100_000
+):
+    """Return the rows of the optimal lineup. The dataframe has the same columns as
+    for "choose_team.create_model()"."""
+    costs = dataframe.cost_ingame.to_numpy() / cost_step
+    cost_units = np.rint(costs).astype(int)
+    if not np.allclose(costs, cost_units):
+        raise ValueError(f"Ingame costs have to be multiples of {cost_step}.")
+
+    chosen = solve_knapsack(
+        dataframe.market_value.to_numpy(),
+        cost_units,
+        dataframe.position.to_numpy(),
+        {position.name: count for position, count in expected_position_counts.items()},
+        int(maximum_ingame_value // cost_step),
+    )
+    return dataframe.iloc[chosen]
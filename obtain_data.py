@@ -1,35 +1,123 @@
 import argparse
+import collections
+import datetime
+import functools
 import logging
 import os
-import pickle
-import time
+from pathlib import Path
 
-from bs4 import BeautifulSoup
 import pandas as pd
-from selenium.webdriver.common.action_chains import ActionChains
-from selenium.webdriver.common.by import By
-from selenium.webdriver.remote.remote_connection import LOGGER as seleniumLogger
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
-from urllib3.connectionpool import log as urllibLogger
 
 import common
+import game_sources
+from http_cache import HttpCache
+import instrumentation
+import store
+
+# The parsers, the browser and the fuzzy matcher are imported only when they are
+# needed. Data, which is served from the cache, doesn't need them.
+
+
+def setup_logging():
+    os.makedirs("work", exist_ok=True)
+    logging.basicConfig(
+        filename="work/example.log",
+        filemode="a",
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        level=logging.DEBUG,
+    )
+    # Avoid too much logging output from selenium and urllib.
+    logging.getLogger("selenium.webdriver.remote.remote_connection").setLevel(
+        logging.WARNING
+    )
+    logging.getLogger("urllib3.connectionpool").setLevel(logging.WARNING)
+
+
+def setup_http_cache(refresh=False):
+    common.http_cache = HttpCache(
+        "work/http_cache",
+        ttls={
+            # The market values get updated only a few times per season.
+            "www.transfermarkt.de": 24 * 60 * 60,
+            "www.kicker-libero.de": 60 * 60,
+            "gaming.uefa.com": 60 * 60,
+        },
+        refresh=refresh,
+    )
+
+
+def parse_market_value(market_value_str) -> int:
+    market_value_list = market_value_str.split(" ", 2)
+    if len(market_value_list) != 3:
+        logging.warning(f"Invalid market value: {market_value_str}")
+        return 0
+
+    if "€" not in market_value_list[2]:
+        logging.warning(
+            f"Invalid currency: {market_value_list[2]}. Only euro supported."
+        )
+        return 0
+
+    market_value = float(market_value_list[0].replace(",", "."))
+    if "Tsd." in market_value_list[1]:
+        market_value *= 10**3
+    elif "Mio." in market_value_list[1]:
+        market_value *= 10**6
+
+    return int(market_value)
+
+
+def has_class(element, class_name):
+    return class_name in (element.get("class") or "").split()
+
+
+def first_text(element, class_name):
+    """Return the text of the first descendant with the class."""
+    for descendant in element.iter():
+        if has_class(descendant, class_name):
+            return "".join(descendant.itertext())
+    raise ValueError(f"No element with class {class_name}.")
 
-# Avoid too much logging output from selenium and urllib.
-seleniumLogger.setLevel(logging.WARNING)
-urllibLogger.setLevel(logging.WARNING)
 
-os.makedirs("work", exist_ok=True)
-logging.basicConfig(
-    filename="work/example.log",
-    filemode="a",
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    level=logging.DEBUG,
-)
+def parse_team_page(html, team_path, chunk_size=2**16):
+    """Parse the players of a single team page. The page is parsed incrementally
+    and only the player rows are processed. Each row is discarded after parsing."""
+    from lxml import etree
+
+    parser = etree.HTMLPullParser(events=("end",), tag="tr")
+
+    data = []
+    for start in range(0, len(html), chunk_size):
+        parser.feed(html[start : start + chunk_size])
+        for _, row in parser.read_events():
+            if not (has_class(row, "even") or has_class(row, "odd")):
+                continue
+            market_value = parse_market_value(first_text(row, "rechts"))
+            # "nationality" means "team" in this case, in order to refactor less.
+            data.append(
+                {
+                    "name_": first_text(row, "hauptlink").strip(),
+                    "market_value": market_value,
+                    "nationality": team_path.split("/")[1],
+                }
+            )
+            row.clear()
+    parser.close()
+    instrumentation.count("rows_parsed", len(data))
+    return data
 
 
 @common.with_session
-def get_data_from_transfermarkt(session, url_all_teams, number_of_teams):
+def get_data_from_transfermarkt(
+    session,
+    url_all_teams,
+    number_of_teams,
+    base_url="https://www.transfermarkt.de",
+    concurrency=8,
+    requests_per_second=None,
+):
+    from bs4 import BeautifulSoup
+
     # Parse all participants and their id.
     page = session.get(url_all_teams)
     page.raise_for_status()
@@ -43,152 +131,44 @@ def get_data_from_transfermarkt(session, url_all_teams, number_of_teams):
             teams.add(href)
     assert len(teams) == number_of_teams, f"{len(teams)=}, {number_of_teams=}, {teams}"
 
-    # Parse the player data team wise.
-    def parse_market_value(market_value_str) -> int:
-        market_value_list = market_value_str.split(" ", 2)
-        if len(market_value_list) != 3:
-            logging.warning(f"Invalid market value: {market_value_str}")
-            return 0
-
-        if "€" not in market_value_list[2]:
-            logging.warning(
-                f"Invalid currency: {market_value_list[2]}. Only euro supported."
-            )
-            return 0
-
-        market_value = float(market_value_list[0].replace(",", "."))
-        if "Tsd." in market_value_list[1]:
-            market_value *= 10**3
-        elif "Mio." in market_value_list[1]:
-            market_value *= 10**6
-
-        return int(market_value)
-
+    # Parse the player data team wise. The team pages are obtained concurrently.
     # TODO: dict with duplicated player name or plain list?
     data = []
-    for team_path in list(teams):
-        team_url = "https://www.transfermarkt.de" + team_path
+    team_paths = {base_url + team_path: team_path for team_path in sorted(teams)}
+    for team_url, page in common.get_concurrently(
+        session,
+        team_paths,
+        concurrency=concurrency,
+        requests_per_second=requests_per_second,
+    ):
         logging.debug(f"{team_url=}")
-        for wait in range(5):
-            page = session.get(team_url)
-            if 200 <= page.status_code < 300:
-                break
-            # try once again if it's a server issue
-            logging.debug(f"{page.status_code=}. Trying again.")
-            time.sleep(wait)
-        page.raise_for_status()
-        soup = BeautifulSoup(page.text, "html.parser")
-
-        players_row = soup.find_all(attrs={"class": "even"}) + soup.find_all(
-            attrs={"class": "odd"}
-        )
-
-        for player in players_row:
-            info = player.find_all(class_="hauptlink")[0]
-            market_value = parse_market_value(player.find_all(class_="rechts")[0].text)
-            # "nationality" means "team" in this case, in order to refactor less.
-            data.append(
-                {
-                    "name_": info.text.strip(),
-                    "market_value": market_value,
-                    "nationality": team_path.split("/")[1],
-                }
-            )
+        data.extend(parse_team_page(page.text, team_paths[team_url]))
     logging.debug("Transfermarkt data obtained.")
     return pd.DataFrame(data)
 
 
-def get_data_from_transfermarkt_em_2024():
+def get_data_from_transfermarkt_em_2024(season=None, **fetch_options):
+    # The tournament has only a single season.
     url_all_teams = "https://www.transfermarkt.de/europameisterschaft-2024/teilnehmer/pokalwettbewerb/EM24/saison_id/2023"
     number_of_teams = 24
-    return get_data_from_transfermarkt(url_all_teams, number_of_teams)
+    return get_data_from_transfermarkt(url_all_teams, number_of_teams, **fetch_options)
 
 
-def get_data_from_transfermarkt_bundesliga():
-    url_all_teams = "https://www.transfermarkt.de/bundesliga/startseite/wettbewerb/L1"
+def get_data_from_transfermarkt_bundesliga(
+    season=store.CURRENT_SEASON, **fetch_options
+):
+    # The season is given by its first year, i.e. "2025" is the season 2025/26.
+    url_all_teams = f"https://www.transfermarkt.de/bundesliga/startseite/wettbewerb/L1/plus/?saison_id={season}"
     number_of_teams = 18
-    return get_data_from_transfermarkt(url_all_teams, number_of_teams)
-
-
-@common.with_driver
-def get_available_players_fantasy(driver):
-    def parse_ingame_value(ingame_value_str) -> int:
-        ingame_value = float(ingame_value_str[:-1])
-        value_prefix = ingame_value_str[-1]
-
-        if value_prefix == "M":
-            ingame_value *= 10**6
-        else:
-            raise ValueError(f"Invalid prefix: {value_prefix}")
-
-        return int(ingame_value)
+    return get_data_from_transfermarkt(url_all_teams, number_of_teams, **fetch_options)
 
-    driver.get("https://gaming.uefa.com/de/uefaeuro2020fantasyfootball/create-team")
-
-    # wait until page is fully loaded
-    player_filter = WebDriverWait(driver, 10).until(
-        EC.presence_of_element_located((By.ID, "PlayreFilters"))
-    )
-    player_table = player_filter.find_element_by_css_selector("div[role='rowgroup']")
-
-    # accept all cookies
-    cookies_button = driver.find_element_by_id("onetrust-accept-btn-handler")
-    cookies_button.click()
-
-    def parse_playes_from_table(player_table):
-        """Parse the players from the currently visible table section.
-        The element stays the same, but the content changes.
-        """
-        player_data = set()
-        players = player_table.find_elements_by_xpath("./div")
-        for player in players:
-            name_elem = player.find_element_by_class_name("si-plyr-name")
-            value_elem = player.find_element_by_class_name("si-currency")
-            currency_elem, value_elem = value_elem.find_elements_by_css_selector("span")
-            position_elem = player.find_element_by_class_name("si-pos")
-            if currency_elem.text != "€":
-                logging.warning(f"Invalid currency {currency_elem.text}. Skipping.")
-                continue
-            if name_elem.text and position_elem.text and value_elem.text:
-                player_data.add(
-                    common.Player(
-                        name=name_elem.text,
-                        ingame_position=common.Position[position_elem.text],
-                        ingame_value=parse_ingame_value(value_elem.text),
-                    )
-                )
-            else:
-                logging.warning(
-                    f"Empty string: {name_elem.text}, {position_elem.text}, {value_elem.text}. Skipping."
-                )
-        return player_data
 
-    player_data = set()
-    wrapped_table = player_filter.find_element_by_class_name("si-list-wrap")
-    slider_element = wrapped_table.find_element_by_xpath("div[1]/div/div[3]/div")
-    last_slider_position = slider_element.location
-    last_player_data = None
-    while True:
-        new_player_data = parse_playes_from_table(player_table)
-        if last_player_data is not None and not (last_player_data & new_player_data):
-            raise Exception("Scrolling failed. Common data is required.")
-        last_player_data = new_player_data
-
-        player_data.update(new_player_data)
-        logging.debug(f"{len(player_data)} players parsed.")
-
-        # Scroll down only a little bit to get the next players.
-        # Couldn't find a better way for now.
-        action = ActionChains(driver)
-        action.click_and_hold(on_element=slider_element)
-        action.move_by_offset(0, 7)
-        action.perform()
-
-        if last_slider_position == slider_element.location:
-            break
-        last_slider_position = slider_element.location
-
-    return player_data
+def get_data_from_transfermarkt_2_bundesliga(
+    season=store.CURRENT_SEASON, **fetch_options
+):
+    url_all_teams = f"https://www.transfermarkt.de/2-bundesliga/startseite/wettbewerb/L2/plus/?saison_id={season}"
+    number_of_teams = 18
+    return get_data_from_transfermarkt(url_all_teams, number_of_teams, **fetch_options)
 
 
 def match_first_letter(current_player, match_options):
@@ -210,36 +190,60 @@ def match_first_letter(current_player, match_options):
     return None
 
 
+# Special cases, because of different naming.
+SPECIAL_MAPPINGS = {
+    "A. Zabolotny": "Anton Zabolotnyi",
+    "Danilo": "Danilo Pereira",
+    "E. Bardi": "Enis Bardhi",
+    "M. Kerem Aktürkoglu": "Kerem Aktürkoglu",
+    "N. Nikolić": "Nemanja Nikolics",
+    "T. Alcántara": "Thiago",
+}
+
+
+class PlayerIndex:
+    """Index of players by family name (with and without special characters) and
+    by the hardcoded special mappings."""
+
+    def __init__(self, players, special_mappings):
+        self.players = list(players)
+        self.by_family_name = collections.defaultdict(list)
+        self.by_family_name_id = collections.defaultdict(list)
+        self.by_special_mapping = collections.defaultdict(list)
+
+        mapped_names = collections.defaultdict(list)
+        for name, mapped_name in special_mappings.items():
+            mapped_names[mapped_name].append(name)
+
+        for position, player in enumerate(self.players):
+            self.by_family_name[player.family_name()].append(position)
+            self.by_family_name_id[player.family_name(special_chars=False)].append(
+                position
+            )
+            for name in mapped_names.get(player.name, []):
+                self.by_special_mapping[name].append(position)
+
+    def candidates(self, player):
+        """Return all players with the same family name or a special mapping in the
+        original order."""
+        positions = set(self.by_family_name.get(player.family_name(), []))
+        positions.update(
+            self.by_family_name_id.get(player.family_name(special_chars=False), [])
+        )
+        positions.update(self.by_special_mapping.get(player.name, []))
+        return [self.players[position] for position in sorted(positions)]
+
+
 def merge_player_data(available_players, player_data_transfermarkt):
     """Try to find stats for each available player by matching names."""
-    # Special cases, because of different naming.
-    special_mappings = {
-        "A. Zabolotny": "Anton Zabolotnyi",
-        "Danilo": "Danilo Pereira",
-        "E. Bardi": "Enis Bardhi",
-        "M. Kerem Aktürkoglu": "Kerem Aktürkoglu",
-        "N. Nikolić": "Nemanja Nikolics",
-        "T. Alcántara": "Thiago",
-    }
+    index = PlayerIndex(player_data_transfermarkt, SPECIAL_MAPPINGS)
 
     complete_players = []
     missing_players = []
     for player in available_players:
         logging.debug(f"Look up {player.name}.")
 
-        possible_matches = []
-        for p in player_data_transfermarkt:
-            if p.family_name() == player.family_name():
-                logging.debug("Found in normal lookup.")
-                possible_matches.append(p)
-            elif p.family_name(special_chars=False) == player.family_name(
-                special_chars=False
-            ):
-                logging.debug("Found in lookup with special chars replaced.")
-                possible_matches.append(p)
-            elif special_mappings.get(player.name, "") == p.name:
-                logging.debug("Found in lookup with hardcoded names.")
-                possible_matches.append(p)
+        possible_matches = index.candidates(player)
 
         matched_player = None
         if possible_matches:
@@ -267,6 +271,34 @@ def merge_player_data(available_players, player_data_transfermarkt):
     return complete_players
 
 
+def merge_sources(
+    player_data_game,
+    player_data_transfermarkt,
+    matcher="exact",
+    review_file="work/match_review.csv",
+):
+    """Match the available players of the game and the transfermarkt players by
+    their names."""
+    player_data_game["name_"] = player_data_game["name_"].str.lower()
+    # special cases
+    player_data_game["name_"] = common.idfy_series(player_data_game["name_"])
+    player_data_transfermarkt["name_"] = common.idfy_series(
+        player_data_transfermarkt["name_"]
+    )
+    if matcher == "fuzzy":
+        import fuzzy_match
+
+        return fuzzy_match.merge(
+            player_data_game,
+            player_data_transfermarkt,
+            review_file=review_file,
+            left_club="club" if "club" in player_data_game else None,
+            right_club="nationality",
+        )
+    # use how="outer" for debugging
+    return player_data_game.merge(player_data_transfermarkt, on="name_", how="inner")
+
+
 def data_to_csv(data, file_):
     with open(file_, "w") as outfile:
         outfile.write(
@@ -280,53 +312,146 @@ def data_to_csv(data, file_):
         )
 
 
-def get_data(filename, obtain_function, force):
-    """Try to use cached data. If not possible, obtain data with function and write to cache."""
-    if not os.path.isfile(filename) or force:
-        data = obtain_function()
-        with open(filename, "wb") as outfile:
-            pickle.dump(data, outfile)
-    else:
-        logging.info(f'Use cached data from "{filename}".')
-        with open(filename, "rb") as infile:
-            data = pickle.load(infile)
-    return data
-
-
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "--force", action="store_true", help="Force refreshing of the cache."
     )
-    args = parser.parse_args()
-
-    player_data_transfermarkt = get_data(
-        "work/transfermarkt.dat", get_data_from_transfermarkt_bundesliga, args.force
+    parser.add_argument(
+        "--concurrency",
+        default=8,
+        type=int,
+        help="Maximum number of concurrent requests.",
     )
-
-    player_data_kicker = pd.read_csv(
-        "https://www.kicker-libero.de/api/sportsdata/v1/players-details/se-k00012025.csv",
-        delimiter=";",
+    parser.add_argument(
+        "--requests-per-second",
+        default=None,
+        type=float,
+        help="Maximum number of requests per second and host.",
     )
-    player_data_kicker = player_data_kicker.rename(
-        columns={
-            "Angezeigter Name": "name_",
-            "Marktwert": "cost_ingame",
-            "Position": "position",
-        }
+    parser.add_argument(
+        "--matcher",
+        choices=("exact", "fuzzy"),
+        default="exact",
+        help=(
+            "How to match the player names. Low confidence fuzzy matches are "
+            'written to "work/match_review.csv".'
+        ),
     )
-    player_data_kicker["name_"] = player_data_kicker["name_"].str.lower()
-    # special cases
-    player_data_kicker["name_"] = player_data_kicker["name_"].apply(common.idfy)
-    player_data_transfermarkt["name_"] = player_data_transfermarkt["name_"].apply(
-        common.idfy
+    parser.add_argument(
+        "--game",
+        choices=game_sources.GAME_SOURCES.keys(),
+        default="kicker",
+        help="Manager game, whose available players are obtained.",
     )
-    # use how="outer" for debugging
-    player_data = player_data_kicker.merge(
-        player_data_transfermarkt, on="name_", how="inner"
+    parser.add_argument(
+        "--no-browser-fallback",
+        action="store_true",
+        help="Don't scrape the game website if the bulk download fails.",
+    )
+    parser.add_argument(
+        "--season",
+        default=store.CURRENT_SEASON,
+        help="First year of the season, for example 2025 for the season 2025/26.",
     )
+    parser.add_argument(
+        "--statistics",
+        default=None,
+        type=Path,
+        help="Write the timers and counters of all stages to a JSON file.",
+    )
+    parser.add_argument(
+        "--profile",
+        action="append",
+        default=[],
+        help=(
+            'Profile a stage by cProfile, for example "transfermarkt" or "match". '
+            '"all" profiles all stages. The profiles are written to work/profiles.'
+        ),
+    )
+    args = parser.parse_args()
+    setup_logging()
+    instrumentation.statistics.profile_stages.update(args.profile)
+
+    setup_http_cache(refresh=args.force)
+
+    with instrumentation.stage("transfermarkt"):
+        player_data_transfermarkt = store.get(
+            store.ROOT,
+            "transfermarkt_bundesliga",
+            args.season,
+            store.TRANSFERMARKT_SCHEMA,
+            functools.partial(
+                get_data_from_transfermarkt_bundesliga,
+                season=args.season,
+                concurrency=args.concurrency,
+                requests_per_second=args.requests_per_second,
+            ),
+            args.force,
+        )
+
+    with instrumentation.stage("game"):
+        player_data_game = game_sources.get_source(args.game, season=args.season).fetch(
+            fallback=not args.no_browser_fallback
+        )
+
+    # Keep the history of market values and game prices. Only changed clubs are
+    # written. Both datasets are keyed by the game, so that they can be read
+    # together for a competition.
+    with instrumentation.stage("history"):
+        today = datetime.date.today().isoformat()
+        changed_clubs = store.write_snapshot(
+            store.HISTORY_ROOT,
+            "transfermarkt",
+            args.game,
+            args.season,
+            today,
+            player_data_transfermarkt,
+            store.TRANSFERMARKT_SCHEMA,
+            club_column="nationality",
+        )
+        changed_clubs += store.write_snapshot(
+            store.HISTORY_ROOT,
+            "game",
+            args.game,
+            args.season,
+            today,
+            player_data_game.reindex(columns=store.GAME_SCHEMA.names),
+            store.GAME_SCHEMA,
+            club_column="club",
+        )
+        instrumentation.count("changed_clubs", len(changed_clubs))
+
+    with instrumentation.stage("match"):
+        player_data = merge_sources(
+            player_data_game, player_data_transfermarkt, args.matcher
+        )
+        instrumentation.count("players_game", len(player_data_game))
+        instrumentation.count("players_transfermarkt", len(player_data_transfermarkt))
+        instrumentation.count("matches", len(player_data))
+
+    with instrumentation.stage("store"):
+        player_data.to_csv("work/test.csv", index=False)
+        store.write(
+            store.ROOT,
+            "players",
+            args.season,
+            player_data[store.PLAYERS_SCHEMA.names],
+            store.PLAYERS_SCHEMA,
+            store.producer_version(main),
+        )
 
-    player_data.to_csv("work/test.csv", index=False)
+    common.http_cache.flush()
+    cache_statistics = common.http_cache.statistics()
+    logging.info(f"HTTP cache: {cache_statistics}")
+    print(
+        f"HTTP cache: {cache_statistics['hits']} hits, "
+        f"{cache_statistics['revalidations']} revalidated, "
+        f"{cache_statistics['misses']} misses"
+    )
+    logging.info(f"Stages:\n{instrumentation.statistics.summary()}")
+    if args.statistics is not None:
+        instrumentation.statistics.write_json(args.statistics)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,355 @@
+"""Plan the squad and the transfers over multiple matchdays.
+
+The plan is optimized by a rolling horizon: For each matchday, the squad and the
+transfers of the next "window" matchdays are optimized, but only the decisions of
+the current matchday are kept. The model of the window is built only once. When
+moving to the next matchday, only the mutable parameters (points, previous squad,
+bank) change and the shifted previous solution is the warm start.
+
+The bank carries over between matchdays: Selling a player gives back the ingame
+value, buying a player costs the ingame value. Initially, the squad is bought from
+the budget.
+"""
+
+import argparse
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyomo.environ as pyomo_env
+from pyomo.core.expr.numeric_expr import LinearExpression
+
+import choose_team
+import lineup_engine
+from players import Position
+import solvers
+import store
+
+MATCHDAYS = 34
+
+
+def create_window_model(dataframe, window):
+    """Create the model of "window" consecutive matchdays. The points, the previous
+    squad, the bank and the transfer rules are mutable parameters."""
+    model = pyomo_env.ConcreteModel()
+    names = dataframe.name_.to_list()
+    slots = list(range(window))
+
+    model.name_ = pyomo_env.Set(initialize=names)
+    model.slots = pyomo_env.Set(initialize=slots)
+    model.points = pyomo_env.Param(model.name_, model.slots, initialize=0, mutable=True)
+    model.previous_squad = pyomo_env.Param(model.name_, initialize=0, mutable=True)
+    model.bank_start = pyomo_env.Param(
+        initialize=choose_team.MAXIMUM_INGAME_VALUE / 10**6, mutable=True
+    )
+    model.transfer_limit = pyomo_env.Param(model.slots, initialize=0, mutable=True)
+    model.transfer_penalty = pyomo_env.Param(model.slots, initialize=0, mutable=True)
+    model.expected_position_count = pyomo_env.Param(
+        list(Position), initialize=choose_team.EXPECTED_POSITION_COUNTS, mutable=True
+    )
+    model.players_per_nation_max = pyomo_env.Param(
+        initialize=choose_team.PLAYERS_PER_NATION[1], mutable=True
+    )
+
+    model.squad = pyomo_env.Var(model.name_, model.slots, within=pyomo_env.Boolean)
+    model.bought = pyomo_env.Var(model.name_, model.slots, within=pyomo_env.Boolean)
+    model.sold = pyomo_env.Var(model.name_, model.slots, within=pyomo_env.Boolean)
+    # The bank is given in Mio. €.
+    model.bank = pyomo_env.Var(model.slots, within=pyomo_env.NonNegativeReals)
+
+    # In Mio. € for a better numerical range.
+    costs = (dataframe.cost_ingame / 10**6).to_list()
+    position_indices = dataframe.groupby("position", sort=False).indices
+    nation_indices = dataframe.groupby("nationality", sort=False).indices
+
+    def linear_sum(variables, coefficients=None):
+        if coefficients is None:
+            coefficients = [1] * len(variables)
+        return LinearExpression(
+            constant=0, linear_coefs=coefficients, linear_vars=variables
+        )
+
+    model.flow = pyomo_env.ConstraintList()
+    model.rules = pyomo_env.ConstraintList()
+    for slot in slots:
+        squad = [model.squad[name, slot] for name in names]
+        bought = [model.bought[name, slot] for name in names]
+        sold = [model.sold[name, slot] for name in names]
+
+        # Constraint: The squad changes only by transfers.
+        for position, name in enumerate(names):
+            previous = (
+                model.previous_squad[name] if slot == 0 else model.squad[name, slot - 1]
+            )
+            model.flow.add(
+                squad[position] - bought[position] + sold[position] == previous
+            )
+
+        # Constraint: The bank carries over. It can't get negative.
+        previous_bank = model.bank_start if slot == 0 else model.bank[slot - 1]
+        model.flow.add(
+            model.bank[slot]
+            == previous_bank
+            + linear_sum(sold + bought, costs + [-cost for cost in costs])
+        )
+
+        # Constraint: Amount of transfers.
+        model.rules.add(linear_sum(bought) <= model.transfer_limit[slot])
+
+        # Constraint: Amount of players for each position.
+        for position in Position:
+            indices = position_indices.get(position.name, [])
+            model.rules.add(
+                linear_sum([squad[index] for index in indices])
+                == model.expected_position_count[position]
+            )
+
+        # Constraint: Maximum amount of players of each national team.
+        for indices in nation_indices.values():
+            model.rules.add(
+                linear_sum([squad[index] for index in indices])
+                <= model.players_per_nation_max
+            )
+
+    # Objective: Maximize the points of the squad minus the transfer penalties.
+    model.total_points = pyomo_env.Objective(
+        expr=sum(
+            model.points[name, slot] * model.squad[name, slot]
+            - model.transfer_penalty[slot] * model.bought[name, slot]
+            for name in names
+            for slot in slots
+        ),
+        sense=pyomo_env.maximize,
+    )
+    return model
+
+
+def shift_solution(model, names, window):
+    """Move the solution one matchday forward as warm start. The last matchday
+    keeps its squad without transfers."""
+    for slot in range(window):
+        source = min(slot + 1, window - 1)
+        for name in names:
+            model.squad[name, slot].set_value(model.squad[name, source].value)
+            transfers = slot + 1 < window
+            model.bought[name, slot].set_value(
+                model.bought[name, source].value if transfers else 0
+            )
+            model.sold[name, slot].set_value(
+                model.sold[name, source].value if transfers else 0
+            )
+        model.bank[slot].set_value(max(0.0, model.bank[source].value))
+
+
+def candidates(dataframe, window_points, squad):
+    """Return a mask of the players, which may be bought in the window. Players,
+    who are dominated by enough cheaper players with more points in the whole
+    window, are excluded. This is a heuristic, since the points of single
+    matchdays are not compared."""
+    mask = squad.copy()
+    window_total = window_points.sum(axis=1)
+    costs = dataframe.cost_ingame.to_numpy()
+    for position, indices in dataframe.groupby("position", sort=False).indices.items():
+        kept = lineup_engine.prune_dominated(
+            window_total[indices],
+            costs[indices],
+            choose_team.EXPECTED_POSITION_COUNTS[Position[position]],
+        )
+        mask[indices[kept]] = True
+    return mask
+
+
+def plan_season(
+    dataframe,
+    points,
+    window=3,
+    max_transfers=3,
+    transfer_penalty=0.0,
+    solver="highs",
+    solver_options=None,
+    prune=True,
+):
+    """Plan the squad for all matchdays by a rolling horizon.
+
+    :param points: Expected points (players x matchdays).
+    :param prune: Don't buy players, who are dominated in the window. This makes
+        the windows much faster to solve.
+    :return: Dataframe with one row per matchday and the squad of each matchday
+        (players x matchdays).
+    """
+    solver_options = {} if solver_options is None else solver_options
+    names = dataframe.name_.to_list()
+    matchdays = points.shape[1]
+    window = min(window, matchdays)
+    model = create_window_model(dataframe, window)
+    backend = solvers.get_backend(solver, warmstart=True, **solver_options)
+
+    squads = np.zeros((len(names), matchdays), dtype=bool)
+    squad = np.zeros(len(names), dtype=bool)
+    bank = choose_team.MAXIMUM_INGAME_VALUE / 10**6
+    rows = []
+    for matchday in range(matchdays):
+        for slot in range(window):
+            in_horizon = matchday + slot < matchdays
+            slot_points = (
+                points[:, matchday + slot] if in_horizon else np.zeros(len(names))
+            )
+            model.points.store_values(
+                {
+                    (name, slot): value
+                    for name, value in zip(names, slot_points.tolist())
+                }
+            )
+            # The initial squad is bought without limit and penalty.
+            initial = matchday == 0 and slot == 0
+            model.transfer_limit[slot] = (
+                len(names) if initial else max_transfers if in_horizon else 0
+            )
+            model.transfer_penalty[slot] = 0 if initial else transfer_penalty
+        model.previous_squad.store_values(dict(zip(names, squad.astype(int).tolist())))
+        model.bank_start = bank
+        if matchday > 0:
+            shift_solution(model, names, window)
+        if prune:
+            window_points = points[:, matchday : matchday + window]
+            buyable = candidates(dataframe, window_points, squad)
+            for name, allowed in zip(names, buyable.tolist()):
+                for slot in range(window):
+                    if allowed:
+                        model.bought[name, slot].unfix()
+                    elif not model.bought[name, slot].value:
+                        model.bought[name, slot].fix(0)
+
+        result = backend.solve(model)
+        if not result.optimal:
+            logging.warning(f"Plan of matchday {matchday + 1} isn't proven optimal.")
+
+        new_squad = np.array([model.squad[name, 0].value > 0.5 for name in names])
+        bank = model.bank[0].value
+        rows.append(
+            {
+                "matchday": matchday + 1,
+                "points": float(points[new_squad, matchday].sum()),
+                "bought": ", ".join(np.array(names)[new_squad & ~squad]),
+                "sold": ", ".join(np.array(names)[squad & ~new_squad]),
+                "bank": round(bank * 10**6),
+                "wall_time": result.wall_time,
+            }
+        )
+        logging.info(f"Matchday {matchday + 1} planned in {result.wall_time:.3f} s.")
+        squad = new_squad
+        squads[:, matchday] = squad
+    return pd.DataFrame(rows), squads
+
+
+def read_projections(projections_file, dataframe, matchdays):
+    """Read the expected points of a csv file with the columns "name_",
+    "matchday" and "points". Missing points are 0."""
+    projections = pd.read_csv(projections_file)
+    projections = projections[projections.matchday.between(1, matchdays)]
+    table = projections.pivot_table(
+        index="name_", columns="matchday", values="points", aggfunc="sum"
+    )
+    table = table.reindex(index=dataframe.name_, columns=range(1, matchdays + 1))
+    return table.fillna(0).to_numpy(dtype=float)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--matchdays", default=MATCHDAYS, type=int)
+    parser.add_argument(
+        "--window",
+        default=3,
+        type=int,
+        help="Number of matchdays, which are optimized together.",
+    )
+    parser.add_argument(
+        "--max-transfers", default=3, type=int, help="Maximum transfers per matchday."
+    )
+    parser.add_argument(
+        "--transfer-penalty",
+        default=0.0,
+        type=float,
+        help="Points lost per transfer.",
+    )
+    parser.add_argument(
+        "--projections",
+        default=None,
+        type=Path,
+        help=(
+            'Csv file with the columns "name_", "matchday" and "points". '
+            "Default: market value in Mio. € for every matchday."
+        ),
+    )
+    parser.add_argument(
+        "--solver",
+        choices=[name for name in solvers.BACKENDS if name != "native"],
+        default="highs",
+        help="Solver backend. highs supports warm starts.",
+    )
+    parser.add_argument(
+        "--time-limit",
+        default=None,
+        type=float,
+        help="Solver time limit per matchday in seconds.",
+    )
+    parser.add_argument(
+        "--mip-gap",
+        default=0.01,
+        type=float,
+        help=(
+            "Relative MIP gap tolerance. The rolling horizon is a heuristic anyway, "
+            "so the default is larger than for a single lineup."
+        ),
+    )
+    parser.add_argument(
+        "--output", default=None, type=Path, help="Write the plan to a csv file."
+    )
+    parser.add_argument(
+        "--season",
+        default=store.CURRENT_SEASON,
+        help="First year of the season of the player data, for example 2025.",
+    )
+    args = parser.parse_args()
+
+    dataframe = store.read(
+        store.ROOT,
+        "players",
+        args.season,
+        store.PLAYERS_SCHEMA,
+        columns=store.PLAYERS_SCHEMA.names,
+    )
+    if dataframe is None:
+        raise Exception("No player data found. Run obtain_data.py first.")
+
+    if args.projections is not None:
+        points = read_projections(args.projections, dataframe, args.matchdays)
+    else:
+        points = np.repeat(
+            dataframe.market_value.to_numpy(dtype=float)[:, None] / 10**6,
+            args.matchdays,
+            axis=1,
+        )
+
+    plan, _ = plan_season(
+        dataframe,
+        points,
+        window=args.window,
+        max_transfers=args.max_transfers,
+        transfer_penalty=args.transfer_penalty,
+        solver=args.solver,
+        solver_options={"time_limit": args.time_limit, "mip_gap": args.mip_gap},
+    )
+    if args.output is not None:
+        plan.to_csv(args.output, index=False)
+    else:
+        print(plan.to_string(index=False))
+    print(
+        f"Total points: {plan.points.sum():.2f}, "
+        f"solved in {plan.wall_time.sum():.3f} s."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""Players and their names.
+
+This module doesn't depend on any third party package, so that it can be imported
+without slowing down the startup.
+"""
+
+from dataclasses import dataclass, field
+import enum
+import functools
+from typing import Optional
+import unicodedata
+
+
+# TODO: Check for better datatype: https://stackoverflow.com/q/31537316/7410886
+class Position(enum.Enum):
+    GOALKEEPER = 0
+    # TW = 0
+    # DEFENSE = 1
+    DEFENDER = 1
+    # AW = 1
+    # MIDFIELD = 2
+    MIDFIELDER = 2
+    # MF = 2
+    # OFFENSE = 3
+    FORWARD = 3
+    # ST = 3
+
+    def __lt__(self, other):
+        return self.value < other.value
+
+
+@dataclass(frozen=True, slots=True)
+class Player:
+    """Represents a player with real as well as game stats."""
+
+    name: str
+    nationality: Optional[str] = None
+    id_transfermarkt_de: Optional[int] = None
+    market_value: Optional[int] = None
+    ingame_position: Optional[Position] = None
+    ingame_value: Optional[int] = None
+
+    # Parts of the name. They are computed only once at construction.
+    _first_name: Optional[str] = field(init=False, repr=False, compare=False)
+    _first_name_id: Optional[str] = field(init=False, repr=False, compare=False)
+    _family_name: str = field(init=False, repr=False, compare=False)
+    _family_name_id: str = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        name_parts = self.name.lower().split(" ", 1)
+        if len(name_parts) == 2:
+            first_name, family_name = name_parts
+            first_name_id = idfy(first_name)
+        else:
+            first_name, family_name = None, name_parts[0]
+            first_name_id = None
+        object.__setattr__(self, "_first_name", first_name)
+        object.__setattr__(self, "_first_name_id", first_name_id)
+        object.__setattr__(self, "_family_name", family_name)
+        object.__setattr__(self, "_family_name_id", idfy(family_name))
+
+    def first_name(self, special_chars=True):
+        return self._first_name if special_chars else self._first_name_id
+
+    def family_name(self, special_chars=True):
+        return self._family_name if special_chars else self._family_name_id
+
+    def __add__(self, other):
+        # Name has to be assigned at both. Take the name of the first player.
+        def merge(field_name, value_self, value_other):
+            if value_self is None:
+                return value_other
+            if value_other is not None:
+                raise ValueError(
+                    f"Can't add players. Too many values for {field_name}: {self} + {other}."
+                )
+            return value_self
+
+        return Player(
+            self.name,
+            merge("nationality", self.nationality, other.nationality),
+            merge(
+                "id_transfermarkt_de",
+                self.id_transfermarkt_de,
+                other.id_transfermarkt_de,
+            ),
+            merge("market_value", self.market_value, other.market_value),
+            merge("ingame_position", self.ingame_position, other.ingame_position),
+            merge("ingame_value", self.ingame_value, other.ingame_value),
+        )
+
+
+PLAYER_COLUMNS = [
+    "name",
+    "nationality",
+    "id_transfermarkt_de",
+    "market_value",
+    "ingame_position",
+    "ingame_value",
+]
+
+
+def players_to_dataframe(players):
+    """Convert players to a dataframe with one column per attribute. The positions
+    are stored by name."""
+    import pandas as pd
+
+    columns = {column: [] for column in PLAYER_COLUMNS}
+    for player in players:
+        for column, values in columns.items():
+            values.append(getattr(player, column))
+    columns["ingame_position"] = [
+        None if position is None else position.name
+        for position in columns["ingame_position"]
+    ]
+    dataframe = pd.DataFrame(columns)
+    for column in ("id_transfermarkt_de", "market_value", "ingame_value"):
+        dataframe[column] = dataframe[column].astype("Int64")
+    dataframe["ingame_position"] = dataframe["ingame_position"].astype("category")
+    return dataframe
+
+
+def players_from_dataframe(dataframe):
+    """Convert a dataframe of "players_to_dataframe()" back to players."""
+    columns = []
+    for column in PLAYER_COLUMNS:
+        values = dataframe[column].astype(object)
+        columns.append(values.where(values.notna(), None).tolist())
+    columns[PLAYER_COLUMNS.index("ingame_position")] = [
+        None if position is None else Position[position]
+        for position in columns[PLAYER_COLUMNS.index("ingame_position")]
+    ]
+    return [Player(*values) for values in zip(*columns)]
+
+
+# Replacements of special characters. Characters without explicit replacement
+# are decomposed and their accents are stripped.
+IDFY_REPLACEMENTS = {
+    "ä": "ae",
+    "æ": "ae",
+    "á": "a",
+    "ą": "a",
+    "ć": "c",
+    "č": "c",
+    "ç": "c",
+    "ď": "d",
+    "é": "e",
+    "ę": "e",
+    "ë": "e",
+    "ğ": "g",
+    "ı": "i",
+    "í": "i",
+    "ï": "i",
+    "ł": "l",
+    "ń": "n",
+    "ň": "n",
+    "ñ": "n",
+    "ö": "oe",
+    "ø": "oe",
+    "ó": "o",
+    "ô": "o",
+    "ß": "ss",
+    "š": "s",
+    "ş": "s",
+    "ś": "s",
+    "ü": "ue",
+    "ú": "u",
+    "ý": "y",
+    "ź": "z",
+    "ž": "z",
+}
+IDFY_TABLE = str.maketrans(IDFY_REPLACEMENTS)
+
+
+def strip_accents(name: str) -> str:
+    """Decompose the characters and remove the accents."""
+    return "".join(
+        character
+        for character in unicodedata.normalize("NFKD", name)
+        if not unicodedata.combining(character)
+    )
+
+
+@functools.lru_cache(maxsize=2**16)
+def idfy(name: str) -> str:
+    """Replace special characters to match player names from different sources."""
+    name_id = name.lower()
+    if name_id.isascii():
+        return name_id
+    name_id = name_id.translate(IDFY_TABLE)
+    if not name_id.isascii():
+        name_id = strip_accents(name_id)
+    return name_id
+
+
+def idfy_series(names):
+    """Apply "idfy()" to a pandas series. All names are joined to a single string,
+    because replacing in a long string is much faster than translating many short
+    strings."""
+    valid = names.notna()
+    joined = "\n".join(names[valid]).lower()
+    for replacement in IDFY_REPLACEMENTS.items():
+        joined = joined.replace(*replacement)
+    names_id = joined.split("\n")
+    if len(names_id) != valid.sum():
+        # Names with line breaks or no names at all.
+        return names.map(idfy, na_action="ignore")
+    if not joined.isascii():
+        names_id = [
+            name_id if name_id.isascii() else strip_accents(name_id)
+            for name_id in names_id
+        ]
+    result = names.copy()
+    result[valid] = names_id
+    return result
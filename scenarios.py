@@ -0,0 +1,388 @@
+"""Lineup optimization over sampled scenarios.
+
+The market value says nothing about whether a player actually plays. Each
+scenario samples for every player, whether the player is available (Bernoulli)
+and how well the player performs (log-normal factor around the score). The scenarios are
+generated in chunks by independent seeds. Thus the worker processes generate
+their chunks themselves and memory is bounded by the chunk size.
+
+Two objectives are supported on the model of "choose_team":
+
+- expected: Maximize the expected points. The points are linear in the chosen
+  players, so the expectation is availability * score per player in closed form.
+  Only the objective coefficients of the model are changed.
+- cvar: Maximize the conditional value at risk, i.e. the mean points of the
+  worst "alpha" fraction of the scenarios, as sample average approximation. The
+  formulation needs one constraint per scenario, but only the scenarios below
+  the threshold "eta" matter. Thus the constraints are added iteratively for the
+  worst scenarios of the current lineup. The model stays at a fraction of the
+  scenarios, so that thousands of scenarios are feasible.
+
+Both lineups are compared with the deterministic lineup on other scenarios than
+the optimized ones.
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyomo.environ as pyomo_env
+from pyomo.core.expr.numeric_expr import LinearExpression
+
+import choose_team
+import features
+import solvers
+import store
+
+
+def sample_chunk(seed, size, scores, availability, volatility):
+    """Sample the points of all players in "size" scenarios. Return a float32
+    matrix (scenarios x players)."""
+    rng = np.random.default_rng(seed)
+    players = len(scores)
+    available = rng.random((size, players), dtype=np.float32) < availability
+    # The performance factor has a mean of 1.
+    performance = rng.lognormal(
+        -0.5 * volatility**2, volatility, (size, players)
+    ).astype(np.float32)
+    return available * performance * scores.astype(np.float32)
+
+
+def chunk_tasks(count, chunk_size, seed):
+    """Split the scenarios into chunks with independent seeds. The result is
+    reproducible for the same arguments."""
+    sizes = [chunk_size] * (count // chunk_size)
+    if count % chunk_size:
+        sizes.append(count % chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    return list(zip(seeds, sizes))
+
+
+def expected_points(scores, availability):
+    """Expected points of each player. The performance factor has a mean of 1."""
+    return availability * scores
+
+
+def _map_chunks(function, tasks, processes=None):
+    processes = min(processes or os.cpu_count() or 1, len(tasks))
+    if processes <= 1:
+        return list(map(function, tasks))
+    with ProcessPoolExecutor(processes) as executor:
+        return list(executor.map(function, tasks))
+
+
+def _sample_chunk(task):
+    return sample_chunk(*task)
+
+
+def sample(
+    scores, availability, volatility, count, chunk_size=1000, seed=0, processes=None
+):
+    """Sample "count" scenarios chunk wise, optionally in multiple processes.
+    Return a float32 matrix (scenarios x players)."""
+    tasks = [
+        (chunk_seed, size, scores, availability, volatility)
+        for chunk_seed, size in chunk_tasks(count, chunk_size, seed)
+    ]
+    return np.concatenate(_map_chunks(_sample_chunk, tasks, processes))
+
+
+def _evaluate_chunk(task):
+    """Return the points sum of each player and the points of each lineup per
+    scenario."""
+    seed, size, scores, availability, volatility, lineups = task
+    points = sample_chunk(seed, size, scores, availability, volatility)
+    return points.sum(axis=0, dtype=np.float64), points @ lineups
+
+
+def evaluate(
+    scores,
+    availability,
+    volatility,
+    count,
+    lineups=None,
+    chunk_size=1000,
+    seed=0,
+    processes=None,
+):
+    """Evaluate all scenarios chunk wise, optionally in multiple processes.
+
+    :param lineups: Matrix (players x lineups) with 1 for chosen players.
+    :return: Mean points of each player and the points of each lineup per
+        scenario (scenarios x lineups).
+    """
+    if lineups is None:
+        lineups = np.zeros((len(scores), 0), dtype=np.float32)
+    tasks = [
+        (chunk_seed, size, scores, availability, volatility, lineups)
+        for chunk_seed, size in chunk_tasks(count, chunk_size, seed)
+    ]
+    player_sums, lineup_points = zip(*_map_chunks(_evaluate_chunk, tasks, processes))
+    mean_points = np.sum(player_sums, axis=0) / count
+    return mean_points, np.concatenate(lineup_points).astype(np.float64)
+
+
+def cvar(points, alpha):
+    """Mean of the worst "alpha" fraction of the points (along the first axis)."""
+    worst = max(1, int(np.ceil(alpha * len(points))))
+    return np.sort(points, axis=0)[:worst].mean(axis=0)
+
+
+def _add_scenarios(model, points, scenarios):
+    """Add the constraints shortfall_s >= eta - points_s * chosen of the
+    scenarios."""
+    chosen = [model.chosen[name] for name in model.name_]
+    for scenario in scenarios:
+        scenario_points = points[scenario]
+        players = np.flatnonzero(scenario_points)
+        model.scenario_shortfall.add(
+            LinearExpression(
+                constant=0,
+                linear_coefs=[*scenario_points[players].tolist(), 1, -1],
+                linear_vars=[
+                    *[chosen[player] for player in players],
+                    model.shortfall[scenario],
+                    model.eta,
+                ],
+            )
+            >= 0
+        )
+
+
+def solve_cvar(model, backend, points, alpha, tolerance=1e-6, max_iterations=20):
+    """Replace the objective by the CVaR of the lineup over the scenarios
+    (scenarios x players, in order of the players) and solve it:
+
+    maximize eta - 1 / (alpha * S) * sum_s shortfall_s
+    with shortfall_s >= eta - points_s * chosen, shortfall_s >= 0
+
+    Only the scenarios below eta matter. Thus the constraints are added only for
+    the worst scenarios of the current lineup, until no other scenario is below
+    eta. The current lineup of the model is the start. Return the result of the
+    last solve and the number of iterations.
+    """
+    worst = max(1, int(np.ceil(alpha * len(points))))
+    model.total_score.deactivate()
+    model.eta = pyomo_env.Var(within=pyomo_env.Reals)
+    model.shortfall = pyomo_env.Var(
+        range(len(points)), within=pyomo_env.NonNegativeReals
+    )
+    model.cvar = pyomo_env.Objective(
+        expr=model.eta - sum(model.shortfall.values()) / (alpha * len(points)),
+        sense=pyomo_env.maximize,
+    )
+    model.scenario_shortfall = pyomo_env.ConstraintList()
+
+    included = np.zeros(len(points), dtype=bool)
+    lineup_points = points @ chosen_mask(model)
+    new = np.argpartition(lineup_points, worst - 1)[:worst]
+    for iteration in range(1, max_iterations + 1):
+        _add_scenarios(model, points, new)
+        included[new] = True
+        result = backend.solve(model)
+        if not result.optimal:
+            break
+        lineup_points = points @ chosen_mask(model)
+        eta = pyomo_env.value(model.eta)
+        below = lineup_points < eta - tolerance * max(1.0, abs(eta))
+        new = np.flatnonzero(below & ~included)
+        if len(new) == 0:
+            break
+        # Add at most the worst "alpha * S" of them to keep the model small.
+        if len(new) > worst:
+            new = new[np.argpartition(lineup_points[new], worst - 1)[:worst]]
+    else:
+        logging.warning(f"CVaR not converged after {max_iterations} iterations.")
+    return result, iteration
+
+
+def chosen_mask(model):
+    return np.array(
+        [pyomo_env.value(model.chosen[name]) > 0.5 for name in model.name_],
+        dtype=np.float32,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--objective",
+        choices=("expected", "cvar"),
+        default="expected",
+        help="Maximize the expected points or the CVaR of the points.",
+    )
+    parser.add_argument(
+        "--scenarios",
+        default=10_000,
+        type=int,
+        help="Number of scenarios for the evaluation.",
+    )
+    parser.add_argument(
+        "--cvar-scenarios",
+        default=5000,
+        type=int,
+        help=(
+            "Number of scenarios for the CVaR optimization. Only the worst of them "
+            "are added to the model."
+        ),
+    )
+    parser.add_argument(
+        "--alpha",
+        default=0.1,
+        type=float,
+        help="Fraction of the worst scenarios for the CVaR.",
+    )
+    parser.add_argument(
+        "--availability",
+        default=0.8,
+        type=float,
+        help=(
+            "Probability that a player plays. Overwritten by the metric "
+            '"availability", if given.'
+        ),
+    )
+    parser.add_argument(
+        "--volatility",
+        default=0.5,
+        type=float,
+        help="Standard deviation of the log-normal performance factor.",
+    )
+    parser.add_argument(
+        "--metrics",
+        action="append",
+        default=[],
+        type=Path,
+        help='Csv file with the column "name_" and additional metrics.',
+    )
+    parser.add_argument(
+        "--weights",
+        default=None,
+        type=features.parse_weights,
+        help="Weights of the metrics for the score. Default: market value.",
+    )
+    parser.add_argument("--chunk-size", default=1000, type=int)
+    parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument(
+        "--processes",
+        default=None,
+        type=int,
+        help="Number of worker processes. Default is the number of CPUs.",
+    )
+    parser.add_argument(
+        "--model-builder",
+        choices=choose_team.MODEL_BUILDERS.keys(),
+        default="vectorized",
+        help="How to build the model. Both builders create the same model.",
+    )
+    parser.add_argument(
+        "--solver",
+        choices=solvers.BACKENDS.keys(),
+        default="highs",
+        help="Solver backend. native supports only the expected points.",
+    )
+    parser.add_argument(
+        "--season",
+        default=store.CURRENT_SEASON,
+        help="First year of the season of the player data, for example 2025.",
+    )
+    args = parser.parse_args()
+    if args.objective == "cvar" and args.solver == "native":
+        parser.error("The native backend supports only the expected points.")
+
+    dataframe = store.read(
+        store.ROOT,
+        "players",
+        args.season,
+        store.PLAYERS_SCHEMA,
+        columns=store.PLAYERS_SCHEMA.names,
+    )
+    if dataframe is None:
+        raise Exception("No player data found. Run obtain_data.py first.")
+    dataframe = features.join_metrics(dataframe, args.metrics)
+
+    if args.weights is None:
+        scores = dataframe.market_value.to_numpy(dtype=float) / 10**6  # Mio. €
+    else:
+        metrics = list(args.weights)
+        scores = features.expected_points(
+            features.feature_matrix(dataframe, metrics), metrics, args.weights
+        )
+    if "availability" in dataframe:
+        availability = dataframe.availability.to_numpy(dtype=np.float32)
+    else:
+        availability = np.full(len(dataframe), args.availability, dtype=np.float32)
+    sampling = {
+        "scores": scores,
+        "availability": availability,
+        "volatility": args.volatility,
+    }
+
+    model = choose_team.MODEL_BUILDERS[args.model_builder](dataframe)
+    # The lineups of the CVaR iterations start from the previous lineup.
+    backend = solvers.get_backend(args.solver, warmstart=True)
+
+    # The lineup of the deterministic model for comparison.
+    choose_team.set_scores(model, scores)
+    backend.solve(model)
+    lineups = {"deterministic": chosen_mask(model)}
+
+    if args.objective == "expected":
+        choose_team.set_scores(model, expected_points(scores, availability))
+        result = backend.solve(model)
+        print(f"Solved with {result.backend} in {result.wall_time:.3f} s.")
+    else:
+        # Use other scenarios than for the evaluation.
+        points = sample(
+            count=args.cvar_scenarios,
+            chunk_size=args.chunk_size,
+            seed=[args.seed, 1],
+            processes=args.processes,
+            **sampling,
+        )
+        result, iterations = solve_cvar(model, backend, points, args.alpha)
+        print(
+            f"Solved with {result.backend} in {iterations} iterations, "
+            f"last in {result.wall_time:.3f} s."
+        )
+    lineups[args.objective] = chosen_mask(model)
+    choose_team.print_results(model)
+
+    # Evaluate both lineups on the same scenarios.
+    _, points = evaluate(
+        lineups=np.column_stack(list(lineups.values())),
+        count=args.scenarios,
+        chunk_size=args.chunk_size,
+        seed=args.seed,
+        processes=args.processes,
+        **sampling,
+    )
+    comparison = pd.DataFrame(
+        {
+            "mean": points.mean(axis=0),
+            "std": points.std(axis=0),
+            "cvar": cvar(points, args.alpha),
+        },
+        index=list(lineups),
+    )
+    print(comparison.round(2))
+
+    # Out of sample, the optimized lineup should be at least as good as the
+    # deterministic one in its objective.
+    measure = {"expected": "mean", "cvar": "cvar"}[args.objective]
+    optimized, deterministic = comparison.loc[
+        [args.objective, "deterministic"], measure
+    ]
+    if optimized < deterministic:
+        logging.warning(
+            f"The {args.objective} lineup is worse than the deterministic lineup "
+            f"out of sample ({measure} {optimized:.2f} < {deterministic:.2f}). "
+            "Consider more scenarios."
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,399 @@
+"""Lineup service.
+
+"choose_team.py" imports the libraries, reads the player data, builds the model and
+starts the solver for every lineup. The service does this only once: The player
+data and one model per worker process stay in memory. Solve requests are answered
+via HTTP on localhost. Identical requests are answered from an LRU cache.
+
+Request (POST /solve, JSON, all keys optional):
+
+    {"exclude": ["player a"], "budget": 42.5, "formation": "3-7-7-5",
+     "nation_min": 0, "nation_max": 30}
+
+The budget is given in Mio. €. The formation is given like in "sweep.py"
+(goalkeeper, defender, midfielder, forward). The response contains the chosen
+players. They are empty, if no optimal lineup was found.
+"""
+
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import math
+import os
+from pathlib import Path
+import threading
+
+import pyomo.environ as pyomo_env
+
+import choose_team
+from players import Position
+import solvers
+import store
+import sweep
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8780
+DEFAULT_REQUEST = {
+    "budget": choose_team.MAXIMUM_INGAME_VALUE / 10**6,
+    "exclude": [],
+    "formation": sweep.format_formation(choose_team.EXPECTED_POSITION_COUNTS),
+    "nation_min": choose_team.PLAYERS_PER_NATION[0],
+    "nation_max": choose_team.PLAYERS_PER_NATION[1],
+}
+
+
+def _number(request, key, integer=False):
+    """Return the number of the key. Booleans and non-finite numbers are invalid."""
+    value = request[key]
+    if (
+        isinstance(value, bool)
+        or not isinstance(value, (int, float))
+        or not math.isfinite(value)
+    ):
+        raise ValueError(f'"{key}" has to be a number, not {value!r}.')
+    if integer:
+        if value != int(value):
+            raise ValueError(f'"{key}" has to be an integer, not {value!r}.')
+        return int(value)
+    return float(value)
+
+
+def normalize_request(request, names):
+    """Validate the request and fill in the defaults. Equal lineups result in equal
+    normalized requests, for example the order of the exclusions doesn't matter."""
+    unknown = set(request) - set(DEFAULT_REQUEST)
+    if unknown:
+        raise ValueError(f"Unknown request keys: {sorted(unknown)}")
+    request = {**DEFAULT_REQUEST, **request}
+
+    exclude = request["exclude"]
+    if not isinstance(exclude, list) or not all(isinstance(n, str) for n in exclude):
+        raise ValueError("The exclusions have to be a list of names.")
+    unknown_players = set(exclude) - names
+    if unknown_players:
+        raise ValueError(f"Unknown players: {sorted(unknown_players)}")
+    if not isinstance(request["formation"], str):
+        raise ValueError('"formation" has to be a string like "3-7-7-5".')
+    formation = sweep.parse_formation(request["formation"])
+    return {
+        "budget": _number(request, "budget"),
+        "exclude": sorted(set(exclude)),
+        "formation": sweep.format_formation(formation),
+        "nation_min": _number(request, "nation_min", integer=True),
+        "nation_max": _number(request, "nation_max", integer=True),
+    }
+
+
+def request_key(request):
+    """Hash of the normalized request."""
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+
+class LruCache:
+    """Thread safe cache, which drops the least recently used entry when full."""
+
+    def __init__(self, size):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_create(self, key, create):
+        """Return the cached value of the key and whether it was cached. Create it
+        if it isn't cached."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key], True
+            self.misses += 1
+            value = self._entries[key] = create()
+            if len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+            return value, False
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# The model and solver of the worker process.
+_worker_model = None
+_worker_backend = None
+
+
+def _init_worker(dataframe, solver, solver_options):
+    global _worker_model, _worker_backend
+    _worker_model = choose_team.create_model_vectorized(dataframe)
+    # The solver output of every request would flood the log of the service.
+    _worker_backend = solvers.get_backend(
+        solver, warmstart=True, solver_log=False, **solver_options
+    )
+
+
+def _solve_request(request):
+    model = _worker_model
+    excluded = set(request["exclude"])
+    for name in model.name_:
+        if name in excluded:
+            model.chosen[name].fix(0)
+        elif model.chosen[name].fixed:
+            model.chosen[name].unfix()
+    sweep.set_parameters(
+        model,
+        {
+            "budget": request["budget"],
+            "formation": sweep.parse_formation(request["formation"]),
+            "nation_min": request["nation_min"],
+            "nation_max": request["nation_max"],
+        },
+    )
+    result = _worker_backend.solve(model)
+
+    players = []
+    if result.optimal:
+        players = [
+            {
+                "name_": name,
+                "position": model.position[name],
+                "nationality": model.nationality[name],
+                "cost_ingame": model.cost_ingame[name],
+                "market_value": model.market_value[name],
+            }
+            for name in model.name_
+            if pyomo_env.value(model.chosen[name]) > 0.5
+        ]
+    return {
+        "players": players,
+        "optimal": result.optimal,
+        "objective": result.objective if result.optimal else None,
+        "backend": result.backend,
+        "wall_time": result.wall_time,
+    }
+
+
+class LineupService:
+    """Solve lineup requests by a pool of worker processes. Each worker builds the
+    model once and keeps it. The cache contains the futures of the solves, so that
+    concurrent identical requests are solved only once."""
+
+    def __init__(
+        self,
+        dataframe,
+        solver="highs",
+        solver_options=None,
+        processes=None,
+        cache_size=1024,
+    ):
+        solver_options = {} if solver_options is None else solver_options
+        self.names = set(dataframe.name_)
+        self.cache = LruCache(cache_size)
+        self._executor = ProcessPoolExecutor(
+            processes or os.cpu_count() or 1,
+            initializer=_init_worker,
+            initargs=(dataframe, solver, solver_options),
+        )
+
+    def solve(self, request):
+        """Return the response of the request. It tells whether it was cached."""
+        request = normalize_request(request, self.names)
+        key = request_key(request)
+        future, cached = self.cache.get_or_create(
+            key, lambda: self._executor.submit(_solve_request, request)
+        )
+        try:
+            response = future.result()
+        except Exception:
+            self.cache.discard(key)  # Don't cache failures.
+            raise
+        return {**response, "key": key, "cached": cached}
+
+    def statistics(self):
+        return {
+            "players": len(self.names),
+            "cache_entries": len(self.cache),
+            "cache_hits": self.cache.hits,
+            "cache_misses": self.cache.misses,
+        }
+
+    def close(self):
+        self._executor.shutdown(cancel_futures=True)
+
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        def send_json(self, status, content):
+            body = json.dumps(content).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self.send_json(200, {"status": "ok"})
+            elif self.path == "/stats":
+                self.send_json(200, service.statistics())
+            else:
+                self.send_json(404, {"error": f"Unknown path: {self.path}"})
+
+        def do_POST(self):
+            if self.path != "/solve":
+                self.send_json(404, {"error": f"Unknown path: {self.path}"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if not isinstance(request, dict):
+                    raise ValueError("The request has to be a JSON object.")
+                response = service.solve(request)
+            except ValueError as error:
+                self.send_json(400, {"error": str(error)})
+            except Exception as error:
+                logging.exception("Solve failed.")
+                self.send_json(500, {"error": repr(error)})
+            else:
+                self.send_json(200, response)
+
+        def log_message(self, format, *args):
+            logging.debug(format % args)
+
+    return Handler
+
+
+def serve(args):
+    dataframe = store.read(
+        store.ROOT,
+        "players",
+        args.season,
+        store.PLAYERS_SCHEMA,
+        columns=store.PLAYERS_SCHEMA.names,
+    )
+    if dataframe is None:
+        raise Exception("No player data found. Run obtain_data.py first.")
+
+    service = LineupService(
+        dataframe,
+        solver=args.solver,
+        solver_options={"time_limit": args.time_limit, "mip_gap": args.mip_gap},
+        processes=args.processes,
+        cache_size=args.cache_size,
+    )
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    logging.info(f"Serving lineups on http://{args.host}:{args.port}.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+def request_lineup(url, request, timeout=60):
+    """Client of the service. Return the response of the solve request."""
+    # Only the client needs requests. It slows down the startup of the service.
+    import requests
+
+    response = requests.post(f"{url}/solve", json=request, timeout=timeout)
+    if response.status_code == 400:
+        raise ValueError(response.json()["error"])
+    response.raise_for_status()
+    return response.json()
+
+
+def solve(args):
+    request = {}
+    if args.exclude_list is not None:
+        request["exclude"] = [
+            name for name in args.exclude_list.read_text().split("\n") if name
+        ]
+    for key in ("budget", "formation", "nation_min", "nation_max"):
+        if getattr(args, key) is not None:
+            request[key] = getattr(args, key)
+
+    response = request_lineup(args.url, request)
+    for player in sorted(
+        response["players"], key=lambda p: (Position[p["position"]], p["name_"])
+    ):
+        print(
+            f"{player['position']:<10} {player['name_']:<30} {player['nationality']:<25} "
+            f"{player['cost_ingame'] / 10**6:>5.1f} {player['market_value'] / 10**6:>7.2f}"
+        )
+    if not response["optimal"]:
+        print("No optimal lineup found.")
+    print(
+        f"Solved with {response['backend']} in {response['wall_time']:.3f} s"
+        f"{' (cached)' if response['cached'] else ''}."
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(required=True)
+
+    parser_serve = subparsers.add_parser("serve", help="Run the service.")
+    parser_serve.add_argument("--host", default=DEFAULT_HOST)
+    parser_serve.add_argument("--port", default=DEFAULT_PORT, type=int)
+    parser_serve.add_argument(
+        "--solver",
+        choices=[name for name in solvers.BACKENDS if name != "native"],
+        default="highs",
+        help="Solver backend. highs supports warm starts.",
+    )
+    parser_serve.add_argument(
+        "--time-limit", default=None, type=float, help="Solver time limit in seconds."
+    )
+    parser_serve.add_argument(
+        "--mip-gap", default=None, type=float, help="Relative MIP gap tolerance."
+    )
+    parser_serve.add_argument(
+        "--processes",
+        default=None,
+        type=int,
+        help="Number of worker processes. Default is the number of CPUs.",
+    )
+    parser_serve.add_argument(
+        "--cache-size", default=1024, type=int, help="Number of cached lineups."
+    )
+    parser_serve.add_argument(
+        "--season",
+        default=store.CURRENT_SEASON,
+        help="First year of the season of the player data, for example 2025.",
+    )
+    parser_serve.set_defaults(function=serve)
+
+    parser_solve = subparsers.add_parser("solve", help="Request a lineup.")
+    parser_solve.add_argument("--url", default=f"http://{DEFAULT_HOST}:{DEFAULT_PORT}")
+    parser_solve.add_argument(
+        "--exclude-list",
+        default=None,
+        type=Path,
+        help="List of players to exclude. Separated by new line.",
+    )
+    parser_solve.add_argument(
+        "--budget", default=None, type=float, help="Budget in Mio. €."
+    )
+    parser_solve.add_argument(
+        "--formation", default=None, help="Formation, for example 3-7-7-5."
+    )
+    parser_solve.add_argument("--nation-min", default=None, type=int)
+    parser_solve.add_argument("--nation-max", default=None, type=int)
+    parser_solve.set_defaults(function=solve)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    args.function(args)
+
+
+if __name__ == "__main__":
+    main()
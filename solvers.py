@@ -0,0 +1,283 @@
+"""Solver backends for the lineup model.
+
+Every backend solves a Pyomo model in place, i.e. the solution is loaded into the
+model variables afterwards. The glpk backend communicates via files and a
+subprocess. The highs and scipy backends solve the model in-process. The native
+backend doesn't need any solver.
+"""
+
+from dataclasses import dataclass
+import logging
+import time
+from typing import Optional
+
+import pyomo.environ as pyomo_env
+from pyomo.opt import SolverFactory, TerminationCondition
+
+import instrumentation
+
+
+@dataclass
+class SolveResult:
+    """Summary of a single solve."""
+
+    backend: str
+    optimal: bool
+    objective: Optional[float]
+    wall_time: float  # seconds
+
+
+class SolverBackend:
+    """Interface of all solver backends."""
+
+    name = None
+
+    def __init__(
+        self,
+        time_limit=None,
+        mip_gap=None,
+        threads=None,
+        warmstart=False,
+        solver_log=True,
+    ):
+        self.time_limit = time_limit  # seconds
+        self.mip_gap = mip_gap  # relative
+        self.threads = threads
+        # Start from the current variable values, if supported by the solver.
+        self.warmstart = warmstart
+        # Log the output of the solver at INFO level. Otherwise at DEBUG level.
+        self.solver_log = solver_log
+
+    def solve(self, model) -> SolveResult:
+        start = time.perf_counter()
+        with instrumentation.stage("solve"):
+            optimal, loaded = self._solve(model)
+        wall_time = time.perf_counter() - start
+
+        if not optimal:
+            logging.warning(f"{self.name} didn't find an optimal solution.")
+        objective = next(model.component_data_objects(pyomo_env.Objective, active=True))
+        result = SolveResult(
+            backend=self.name,
+            optimal=optimal,
+            # Without loaded solution, the variables are stale.
+            objective=pyomo_env.value(objective, exception=False) if loaded else None,
+            wall_time=wall_time,
+        )
+        logging.info(f"Solved with {self.name} in {wall_time:.3f} s.")
+        return result
+
+    def _solve(self, model) -> tuple[bool, bool]:
+        """Solve the model and load the solution. Return whether it is optimal and
+        whether a solution was loaded. A feasible solution can be loaded without
+        being optimal, for example after the time limit."""
+        raise NotImplementedError
+
+
+class GlpkBackend(SolverBackend):
+    """GLPK via the "glpsol" executable. The model is written to a LP file."""
+
+    name = "glpk"
+
+    def _solve(self, model):
+        opt = SolverFactory("glpk")
+        if self.time_limit is not None:
+            opt.options["tmlim"] = max(1, int(self.time_limit))
+        if self.mip_gap is not None:
+            opt.options["mipgap"] = self.mip_gap
+        if self.threads is not None:
+            logging.warning("glpk is single threaded. Ignoring the thread count.")
+        results = opt.solve(model)
+        optimal = results.solver.termination_condition == TerminationCondition.optimal
+        # Solutions are loaded by Pyomo, but only optimal ones are trusted.
+        return optimal, optimal
+
+
+class HighsBackend(SolverBackend):
+    """HiGHS via the in-process "highspy" bindings. The solver instance is
+    persistent, i.e. only changes of the model are transferred when solving the
+    same model again."""
+
+    name = "highs"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._opt = None
+
+    def _solve(self, model):
+        if self._opt is None:
+            from pyomo.contrib.appsi.solvers import Highs
+
+            self._opt = Highs()
+            self._opt.config.time_limit = self.time_limit
+            self._opt.config.mip_gap = self.mip_gap
+            self._opt.config.load_solution = False
+            self._opt.config.warmstart = self.warmstart
+            if not self.solver_log:
+                self._opt.config.log_level = logging.DEBUG
+            if self.threads is not None:
+                self._opt.highs_options["threads"] = self.threads
+        results = self._opt.solve(model)
+        if results.best_feasible_objective is not None:
+            # Round the integer variables to avoid domain warnings of values like
+            # 0.9999999999999.
+            for variable, value in results.solution_loader.get_primals().items():
+                if variable.is_integer():
+                    value = round(value)
+                variable.set_value(value, skip_validation=True)
+        return (
+            results.termination_condition.name == "optimal",
+            results.best_feasible_objective is not None,
+        )
+
+
+class ScipyBackend(SolverBackend):
+    """HiGHS via "scipy.optimize.milp". The constraint matrices are extracted
+    directly from the model."""
+
+    name = "scipy"
+
+    def _solve(self, model):
+        import numpy as np
+        from scipy.optimize import Bounds, LinearConstraint, milp
+
+        c, integrality, bounds, constraint, variables = to_matrices(model)
+        options = {}
+        if self.time_limit is not None:
+            options["time_limit"] = self.time_limit
+        if self.mip_gap is not None:
+            options["mip_rel_gap"] = self.mip_gap
+        if self.threads is not None:
+            logging.warning("scipy doesn't support a thread count. Ignoring it.")
+
+        result = milp(
+            c,
+            integrality=integrality,
+            bounds=Bounds(*bounds),
+            constraints=LinearConstraint(*constraint),
+            options=options,
+        )
+        if result.x is None:
+            return False, False
+        values = np.where(integrality == 1, np.round(result.x), result.x)
+        for variable, value in zip(variables, values.tolist()):
+            variable.set_value(value, skip_validation=True)
+        return result.status == 0, True
+
+
+class NativeBackend(SolverBackend):
+    """Exact dynamic programming of "lineup_engine". No external solver is needed,
+    but only the lineup model without binding nation limits is supported."""
+
+    name = "native"
+
+    def _solve(self, model):
+        import pandas as pd
+
+        import lineup_engine
+
+        if not model.total_score.active:
+            raise ValueError("Only the score objective is supported by native backend.")
+        if len(getattr(model, "no_good_cuts", ())) > 0:
+            raise ValueError("No-good cuts aren't supported by native backend.")
+        total_players = pyomo_env.value(model.expected_total_players)
+        if (
+            pyomo_env.value(model.players_per_nation_min) > 0
+            or pyomo_env.value(model.players_per_nation_max) < total_players
+        ):
+            raise ValueError("Nation limits aren't supported by native backend.")
+        expected_position_counts = {
+            position: pyomo_env.value(count)
+            for position, count in model.expected_position_count.items()
+        }
+        if sum(expected_position_counts.values()) != total_players:
+            raise ValueError("Position counts don't sum up to the total players.")
+
+        dataframe = pd.DataFrame(
+            {
+                "name_": list(model.name_),
+                "cost_ingame": [model.cost_ingame[i] for i in model.name_],
+                "market_value": [pyomo_env.value(model.score[i]) for i in model.name_],
+                "position": [model.position[i] for i in model.name_],
+            }
+        )
+        try:
+            team = lineup_engine.solve_lineup(
+                dataframe,
+                expected_position_counts,
+                pyomo_env.value(model.maximum_ingame_value),
+            )
+        except lineup_engine.InfeasibleError as error:
+            logging.info(f"{self.name}: {error}")
+            return False, False
+        chosen = set(team.name_)
+        for name in model.name_:
+            model.chosen[name].set_value(int(name in chosen))
+        return True, True
+
+
+def to_matrices(model):
+    """Convert the linear model to the scipy "milp" format: objective vector (to
+    minimize), integrality, variable bounds and constraint
+    matrix with row bounds."""
+    import numpy as np
+    from pyomo.repn.standard_repn import generate_standard_repn
+    from scipy.sparse import coo_array
+
+    variables = []
+    column = {}
+
+    def column_of(variable):
+        index = column.get(id(variable))
+        if index is None:
+            index = column[id(variable)] = len(variables)
+            variables.append(variable)
+        return index
+
+    objective = next(model.component_data_objects(pyomo_env.Objective, active=True))
+    repn = generate_standard_repn(objective.expr, compute_values=True)
+    if not repn.is_linear():
+        raise ValueError("Only linear objectives are supported.")
+    sign = -1.0 if objective.sense == pyomo_env.maximize else 1.0
+    objective_terms = {
+        column_of(v): sign * c for v, c in zip(repn.linear_vars, repn.linear_coefs)
+    }
+
+    rows, columns, coefficients, lower, upper = [], [], [], [], []
+    for row, con in enumerate(
+        model.component_data_objects(pyomo_env.Constraint, active=True)
+    ):
+        repn = generate_standard_repn(con.body, compute_values=True)
+        if not repn.is_linear():
+            raise ValueError(f"Only linear constraints are supported: {con.name}")
+        for v, c in zip(repn.linear_vars, repn.linear_coefs):
+            rows.append(row)
+            columns.append(column_of(v))
+            coefficients.append(c)
+        con_lower = pyomo_env.value(con.lower) if con.has_lb() else -np.inf
+        con_upper = pyomo_env.value(con.upper) if con.has_ub() else np.inf
+        lower.append(con_lower - repn.constant)
+        upper.append(con_upper - repn.constant)
+
+    c = np.zeros(len(variables))
+    c[list(objective_terms)] = list(objective_terms.values())
+    integrality = np.array([int(v.is_integer()) for v in variables])
+    bounds = (
+        np.array([-np.inf if v.lb is None else v.lb for v in variables], dtype=float),
+        np.array([np.inf if v.ub is None else v.ub for v in variables], dtype=float),
+    )
+    matrix = coo_array(
+        (coefficients, (rows, columns)), shape=(len(lower), len(variables))
+    ).tocsr()
+    constraint = (matrix, np.array(lower), np.array(upper))
+    return c, integrality, bounds, constraint, variables
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (GlpkBackend, HighsBackend, ScipyBackend, NativeBackend)
+}
+
+
+def get_backend(name, **options) -> SolverBackend:
+    return BACKENDS[name](**options)
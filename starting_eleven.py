@@ -0,0 +1,199 @@
+"""Starting eleven of the squad.
+
+The games score only the starting eleven, which has to play in one of the allowed
+formations. Formations are given by the outfield players, for example "4-4-2"
+(defender, midfielder, forward). There is always one goalkeeper.
+
+The formations are encoded compactly in the lineup model: One binary variable per
+formation selects the formation. The amount of starting players per position
+equals the count of the selected formation.
+
+For a given squad, the best starting eleven doesn't need any solver: For each
+formation, the best players of each position are taken. The formation with the
+most points wins.
+"""
+
+import argparse
+from pathlib import Path
+
+import pyomo.environ as pyomo_env
+
+from players import Position
+
+FORMATIONS = ("3-4-3", "3-5-2", "4-3-3", "4-4-2", "4-5-1", "5-3-2", "5-4-1")
+
+
+def parse_formation(formation_str):
+    """Parse a formation of the form "4-4-2" (defender, midfielder, forward)."""
+    counts = [int(count) for count in formation_str.split("-")]
+    if len(counts) != len(Position) - 1 or sum(counts) != 10:
+        raise ValueError(f"Invalid formation: {formation_str}")
+    return {
+        Position.GOALKEEPER: 1,
+        **dict(zip([Position.DEFENDER, Position.MIDFIELDER, Position.FORWARD], counts)),
+    }
+
+
+def parse_formations(formations_str):
+    return {
+        formation_str: parse_formation(formation_str)
+        for formation_str in formations_str.split(",")
+    }
+
+
+def add_starting_eleven(model, formations, bench_weight=0.1):
+    """Extend the lineup model by the starting eleven. The objective is replaced
+    by the score of the starting eleven plus "bench_weight" times the score of
+    the whole squad, so that the substitutes are still relevant."""
+    model.formation_names = pyomo_env.Set(initialize=list(formations))
+    model.formation = pyomo_env.Var(model.formation_names, within=pyomo_env.Boolean)
+    model.starting = pyomo_env.Var(model.name_, within=pyomo_env.Boolean, initialize=0)
+
+    # Constraint: Exactly one formation.
+    model.one_formation = pyomo_env.Constraint(
+        expr=sum(model.formation[f] for f in model.formation_names) == 1
+    )
+
+    # Constraint: Only players of the squad can start.
+    def starting_in_squad_rule(model, i):
+        return model.starting[i] <= model.chosen[i]
+
+    model.starting_in_squad = pyomo_env.Constraint(
+        model.name_, rule=starting_in_squad_rule
+    )
+
+    # Constraint: Amount of starting players for each position.
+    names_by_position = {position.name: [] for position in Position}
+    for i in model.name_:
+        names_by_position[model.position[i]].append(i)
+
+    def starting_position_rule(model, position):
+        return sum(model.starting[i] for i in names_by_position[position.name]) == sum(
+            formations[f][position] * model.formation[f] for f in model.formation_names
+        )
+
+    model.starting_positions = pyomo_env.Constraint(
+        list(Position), rule=starting_position_rule
+    )
+
+    # Objective: Maximize the score of the starting eleven and the squad.
+    model.total_score.deactivate()
+    model.lineup_score = pyomo_env.Objective(
+        expr=sum(
+            model.score[i] * (model.starting[i] + bench_weight * model.chosen[i])
+            for i in model.name_
+        ),
+        sense=pyomo_env.maximize,
+    )
+
+
+def chosen_formation(model):
+    return next(
+        f for f in model.formation_names if pyomo_env.value(model.formation[f]) > 0.5
+    )
+
+
+def choose_starting_eleven(squad, formations, score_column="score"):
+    """Choose the best starting eleven of the squad without solver.
+
+    Return the name of the formation and the rows of the starting players.
+    """
+    import numpy as np
+    import pandas as pd
+
+    squad = squad.sort_values(score_column, ascending=False, kind="stable")
+    by_position = {
+        position: squad[squad.position == position.name] for position in Position
+    }
+    # Points of the best n players of each position: cumulative[position][n]
+    cumulative = {
+        position: np.concatenate(([0], rows[score_column].cumsum().to_numpy()))
+        for position, rows in by_position.items()
+    }
+
+    best_formation, best_points = None, -np.inf
+    for name, counts in formations.items():
+        if any(len(cumulative[p]) <= count for p, count in counts.items()):
+            continue  # not enough players for the formation
+        points = sum(cumulative[p][count] for p, count in counts.items())
+        if points > best_points:
+            best_formation, best_points = name, points
+    if best_formation is None:
+        raise ValueError("The squad doesn't fit any formation.")
+
+    starting = pd.concat(
+        [
+            by_position[position].head(count)
+            for position, count in formations[best_formation].items()
+        ]
+    )
+    return best_formation, starting
+
+
+def main():
+    import pandas as pd
+
+    import store
+
+    parser = argparse.ArgumentParser(
+        description="Choose the starting eleven of a given squad."
+    )
+    parser.add_argument(
+        "--squad",
+        required=True,
+        type=Path,
+        help="List of the players in the squad. Separated by new line.",
+    )
+    parser.add_argument(
+        "--formations",
+        default=",".join(FORMATIONS),
+        help="Comma separated allowed formations, for example 3-4-3,4-4-2,4-5-1.",
+    )
+    parser.add_argument(
+        "--points",
+        default=None,
+        type=Path,
+        help=(
+            'Csv file with the columns "name_" and "points" of the next matchday. '
+            "Default: market value."
+        ),
+    )
+    parser.add_argument(
+        "--season",
+        default=store.CURRENT_SEASON,
+        help="First year of the season of the player data, for example 2025.",
+    )
+    args = parser.parse_args()
+
+    dataframe = store.read(
+        store.ROOT,
+        "players",
+        args.season,
+        store.PLAYERS_SCHEMA,
+        columns=store.PLAYERS_SCHEMA.names,
+    )
+    if dataframe is None:
+        raise Exception("No player data found. Run obtain_data.py first.")
+    squad_names = [name for name in args.squad.read_text().split("\n") if name]
+    squad = dataframe[dataframe.name_.isin(squad_names)].copy()
+    missing = set(squad_names) - set(squad.name_)
+    if missing:
+        raise ValueError(f"Unknown players: {sorted(missing)}")
+
+    if args.points is not None:
+        points = pd.read_csv(args.points).set_index("name_")["points"]
+        squad["score"] = squad.name_.map(points).fillna(0).to_numpy()
+    else:
+        squad["score"] = squad.market_value / 10**6
+
+    formation, starting = choose_starting_eleven(
+        squad, parse_formations(args.formations)
+    )
+    print(f"Formation: {formation}, points: {starting.score.sum():.2f}")
+    print(
+        starting[["position", "name_", "nationality", "score"]].to_string(index=False)
+    )
+
+
+if __name__ == "__main__":
+    main()
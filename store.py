@@ -0,0 +1,368 @@
+"""Columnar cache of dataframes.
+
+Each dataframe is stored as Parquet file, partitioned by source and season:
+"<root>/source=<source>/season=<season>/data.parquet". The file metadata contains
+the schema version and the version of the producing code. Entries with a different
+version or schema are treated as missing, so they get obtained again.
+
+Additionally, there is a historical store of snapshots, partitioned by dataset,
+competition, season and snapshot date:
+"<root>/<dataset>/competition=<competition>/season=<season>/snapshot=<date>/data.parquet".
+A snapshot contains only the clubs, whose rows changed since the previous
+snapshot. A club, which disappeared, gets a single row with the column "removed"
+set and all other columns except the club empty. The state at a date consists of
+the latest rows of each club, which isn't removed.
+
+The player pool of multiple competitions is partitioned by competition and season:
+"<root>/competition=<competition>/season=<season>/data.parquet". Each competition
+is written separately, so they can be obtained in parallel.
+"""
+
+import hashlib
+import inspect
+import json
+import logging
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Increment when the layout of the stored data changes.
+SCHEMA_VERSION = 1
+METADATA_KEY = b"fantasy_football_lineup"
+
+ROOT = "work/store"
+HISTORY_ROOT = "work/history"
+POOL_ROOT = "work/pool"
+CURRENT_SEASON = "2025"
+
+# Market values of transfermarkt.
+TRANSFERMARKT_SCHEMA = pa.schema(
+    [
+        ("name_", pa.string()),
+        ("market_value", pa.int64()),
+        ("nationality", pa.string()),
+    ]
+)
+# Available players of a manager game.
+GAME_SCHEMA = pa.schema(
+    [
+        ("name_", pa.string()),
+        ("cost_ingame", pa.int64()),
+        ("position", pa.string()),
+        ("club", pa.string()),
+    ]
+)
+# Merged player data, which is the input of the lineup optimization.
+PLAYERS_SCHEMA = pa.schema(
+    [
+        ("nationality", pa.string()),
+        ("name_", pa.string()),
+        ("cost_ingame", pa.int64()),
+        ("position", pa.string()),
+        ("market_value", pa.int64()),
+    ]
+)
+
+
+def producer_version(function):
+    """Version of the code that produces the data: Hash of the source file of the
+    function. Any change of the file invalidates the stored data."""
+    while hasattr(function, "func"):  # functools.partial
+        function = function.func
+    function = inspect.unwrap(function)
+    with open(inspect.getsourcefile(function), "rb") as infile:
+        return hashlib.sha256(infile.read()).hexdigest()[:16]
+
+
+def _path(root, source, season):
+    return os.path.join(root, f"source={source}", f"season={season}", "data.parquet")
+
+
+def write(root, source, season, dataframe, schema, version):
+    """Write the dataframe. The columns are converted to the schema."""
+    table = pa.Table.from_pandas(dataframe, schema=schema, preserve_index=False)
+    metadata = {
+        "schema_version": SCHEMA_VERSION,
+        "producer_version": version,
+        "source": source,
+        "season": season,
+    }
+    table = table.replace_schema_metadata(
+        {**(table.schema.metadata or {}), METADATA_KEY: json.dumps(metadata)}
+    )
+    path = _path(root, source, season)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pq.write_table(table, path)
+
+
+def read(root, source, season, schema, version=None, columns=None):
+    """Read the dataframe. Only the given columns are loaded. Return None if there
+    is no entry or the entry is stale."""
+    path = _path(root, source, season)
+    if not os.path.isfile(path):
+        return None
+
+    stored_schema = pq.read_schema(path)
+    metadata = json.loads((stored_schema.metadata or {}).get(METADATA_KEY, b"{}"))
+    if metadata.get("schema_version") != SCHEMA_VERSION:
+        logging.info(f'Schema version of "{path}" changed.')
+        return None
+    if version is not None and metadata.get("producer_version") != version:
+        logging.info(f'Producer of "{path}" changed.')
+        return None
+    if not stored_schema.remove_metadata().equals(schema):
+        logging.info(f'Schema of "{path}" changed.')
+        return None
+
+    table = pq.read_table(path, columns=columns, memory_map=True)
+    return table.to_pandas()
+
+
+def get(root, source, season, schema, obtain_function, force, columns=None):
+    """Try to use stored data. If not possible, obtain data with function and
+    store it."""
+    version = producer_version(obtain_function)
+    data = None if force else read(root, source, season, schema, version, columns)
+    if data is None:
+        data = obtain_function()
+        write(root, source, season, data, schema, version)
+        if columns is not None:
+            data = data[columns]
+    else:
+        logging.info(f"Use stored data of {source=}, {season=}.")
+    return data
+
+
+# Partition columns of the historical store. ISO dates are ordered as strings.
+HISTORY_PARTITIONING = pa.schema(
+    [
+        ("competition", pa.string()),
+        ("season", pa.string()),
+        ("snapshot", pa.string()),
+    ]
+)
+
+
+# Column of the snapshots, which marks removed clubs. Older snapshots don't contain
+# it, so it is read as null.
+REMOVAL_SCHEMA = pa.schema([("removed", pa.bool_())])
+
+
+def _snapshot_path(root, dataset, competition, season, snapshot):
+    return os.path.join(
+        root,
+        dataset,
+        f"competition={competition}",
+        f"season={season}",
+        f"snapshot={snapshot}",
+        "data.parquet",
+    )
+
+
+def _partition_filter(competitions=None, seasons=None):
+    filter_ = None
+    conditions = []
+    if competitions is not None:
+        conditions.append(ds.field("competition").isin(list(competitions)))
+    if seasons is not None:
+        conditions.append(ds.field("season").isin([str(s) for s in seasons]))
+    for condition in conditions:
+        filter_ = condition if filter_ is None else filter_ & condition
+    return filter_
+
+
+def read_history(
+    root, dataset, schema, competitions=None, seasons=None, until=None, columns=None
+):
+    """Read all snapshots of the dataset, optionally filtered by competitions,
+    seasons and the last snapshot date. The filters are applied to the partitions,
+    so only the matching files are read. The result contains the partition columns
+    "competition", "season" and "snapshot" and the removal marker "removed"."""
+    directory = os.path.join(root, dataset)
+    if not os.path.isdir(directory):
+        return None
+
+    dataset_ = ds.dataset(
+        directory,
+        schema=pa.unify_schemas([schema, REMOVAL_SCHEMA, HISTORY_PARTITIONING]),
+        format="parquet",
+        partitioning=ds.partitioning(HISTORY_PARTITIONING, flavor="hive"),
+    )
+    filter_ = _partition_filter(competitions, seasons)
+    if until is not None:
+        condition = ds.field("snapshot") <= str(until)
+        filter_ = condition if filter_ is None else filter_ & condition
+    if columns is not None:
+        columns = list(
+            dict.fromkeys(
+                [*columns, *REMOVAL_SCHEMA.names, *HISTORY_PARTITIONING.names]
+            )
+        )
+    return dataset_.to_table(columns=columns, filter=filter_).to_pandas()
+
+
+def latest_state(history, club_column):
+    """Reduce snapshots to the latest rows of each club per competition and
+    season. Removed clubs are dropped."""
+    keys = ["competition", "season", club_column]
+    latest = history.groupby(keys, sort=False)["snapshot"].transform("max")
+    removed = history.removed.eq(True)
+    return (
+        history[(history.snapshot == latest) & ~removed]
+        .drop(columns="removed")
+        .reset_index(drop=True)
+    )
+
+
+def read_snapshot(
+    root, dataset, competition, season, schema, club_column, date=None, columns=None
+):
+    """Return the state of a competition and season at the date (default: latest
+    snapshot) or None if there is no snapshot."""
+    history = read_history(
+        root,
+        dataset,
+        schema,
+        competitions=[competition],
+        seasons=[season],
+        until=date,
+        columns=(
+            None if columns is None else list(dict.fromkeys([*columns, club_column]))
+        ),
+    )
+    if history is None or history.empty:
+        return None
+    state = latest_state(history, club_column)
+    # The empty values of the removal markers turn integer columns to float.
+    # Restore the types of the schema.
+    columns = schema.names if columns is None else columns
+    return pa.Table.from_pandas(
+        state[columns],
+        schema=pa.schema([schema.field(column) for column in columns]),
+        preserve_index=False,
+    ).to_pandas()
+
+
+def write_snapshot(
+    root, dataset, competition, season, date, dataframe, schema, club_column
+):
+    """Store the dataframe as snapshot of the date. Only the clubs, whose rows
+    changed since the previous snapshot, are written. Clubs of the previous
+    snapshot, which are missing, are marked as removed. Return the changed and
+    removed clubs."""
+    # Convert to the schema and sort, so that the rows are comparable.
+    dataframe = (
+        pa.Table.from_pandas(dataframe, schema=schema, preserve_index=False)
+        .sort_by(
+            [(club_column, "ascending")]
+            + [(name, "ascending") for name in schema.names if name != club_column]
+        )
+        .to_pandas()
+    )
+    dataframe[club_column] = dataframe[club_column].fillna("")
+    # Rewriting a snapshot of the same date replaces it.
+    previous_date = (pd.Timestamp(date) - pd.Timedelta(days=1)).date().isoformat()
+    previous = read_snapshot(
+        root, dataset, competition, season, schema, club_column, date=previous_date
+    )
+
+    # The hashes depend on the dtypes. Integer columns with empty values are float
+    # after the conversion to pandas, so both sides use nullable integers.
+    integer_columns = {
+        field.name: "Int64" for field in schema if pa.types.is_integer(field.type)
+    }
+
+    def club_hashes(data):
+        data = data.astype(integer_columns)
+        hashes = pd.util.hash_pandas_object(data, index=False)
+        return hashes.groupby(data[club_column].to_numpy()).agg(tuple).to_dict()
+
+    current_hashes = club_hashes(dataframe)
+    previous_hashes = {} if previous is None else club_hashes(previous)
+    changed_clubs = sorted(
+        club
+        for club, hashes in current_hashes.items()
+        if previous_hashes.get(club) != hashes
+    )
+
+    removed_clubs = sorted(set(previous_hashes) - set(current_hashes))
+
+    path = _snapshot_path(root, dataset, competition, season, date)
+    if not changed_clubs and not removed_clubs:
+        if os.path.isfile(path):
+            os.remove(path)
+        logging.info(f"No changes of {dataset=}, {competition=}, {season=}.")
+        return changed_clubs
+
+    table = pa.Table.from_pandas(
+        dataframe[dataframe[club_column].isin(changed_clubs)],
+        schema=schema,
+        preserve_index=False,
+    )
+    table = table.append_column("removed", pa.array([False] * len(table), pa.bool_()))
+    tombstones = pa.table(
+        {
+            **{
+                field.name: (
+                    pa.array(removed_clubs, field.type)
+                    if field.name == club_column
+                    else pa.nulls(len(removed_clubs), field.type)
+                )
+                for field in schema
+            },
+            "removed": pa.array([True] * len(removed_clubs), pa.bool_()),
+        },
+    )
+    table = pa.concat_tables([table, tombstones])
+    table = table.replace_schema_metadata(
+        {METADATA_KEY: json.dumps({"schema_version": SCHEMA_VERSION})}
+    )
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pq.write_table(table, path)
+    logging.info(
+        f"Snapshot {date} of {dataset=}, {competition=}, {season=}: "
+        f"{len(changed_clubs)} of {len(current_hashes)} clubs changed, "
+        f"{len(removed_clubs)} removed."
+    )
+    return changed_clubs + removed_clubs
+
+
+# Partition columns of the player pool.
+POOL_PARTITIONING = pa.schema([("competition", pa.string()), ("season", pa.string())])
+
+
+def write_pool(root, competition, season, dataframe, schema=PLAYERS_SCHEMA):
+    """Write the players of a competition and season. The partition is replaced."""
+    path = os.path.join(
+        root, f"competition={competition}", f"season={season}", "data.parquet"
+    )
+    table = pa.Table.from_pandas(dataframe, schema=schema, preserve_index=False)
+    table = table.replace_schema_metadata(
+        {METADATA_KEY: json.dumps({"schema_version": SCHEMA_VERSION})}
+    )
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pq.write_table(table, path)
+
+
+def read_pool(
+    root, competitions=None, seasons=None, schema=PLAYERS_SCHEMA, columns=None
+):
+    """Read the players of the pool, optionally filtered by competitions and
+    seasons. Only the matching partitions are read. The result contains the
+    partition columns "competition" and "season"."""
+    if not os.path.isdir(root):
+        return None
+    dataset_ = ds.dataset(
+        root,
+        schema=pa.unify_schemas([schema, POOL_PARTITIONING]),
+        format="parquet",
+        partitioning=ds.partitioning(POOL_PARTITIONING, flavor="hive"),
+    )
+    if columns is not None:
+        columns = list(dict.fromkeys([*columns, *POOL_PARTITIONING.names]))
+    return dataset_.to_table(
+        columns=columns, filter=_partition_filter(competitions, seasons)
+    ).to_pandas()
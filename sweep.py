@@ -0,0 +1,224 @@
+"""Parameter sweeps over the rules of the game.
+
+The model is built once per worker process. For each sweep point, only the mutable
+parameters of the model are changed and the solver starts from the previous
+solution.
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyomo.environ as pyomo_env
+
+import choose_team
+from players import Position
+import solvers
+import store
+
+# Sweepable parameters and their model parameter.
+SWEEP_PARAMETERS = {
+    "budget": "maximum_ingame_value",  # Mio. €
+    "nation_min": "players_per_nation_min",
+    "nation_max": "players_per_nation_max",
+}
+
+
+def parse_sweep(sweep_str):
+    """Parse a sweep of the form "name=start:stop:step". The stop is inclusive."""
+    name, range_str = sweep_str.split("=", 1)
+    if name not in SWEEP_PARAMETERS:
+        raise ValueError(f"Invalid sweep parameter: {name}")
+    start, stop, step = [float(value) for value in range_str.split(":")]
+    # Round to avoid floating point artifacts like 40.50000000000001.
+    values = np.round(np.arange(start, stop + step / 2, step), 6)
+    return name, values.tolist()
+
+
+def parse_formation(formation_str):
+    """Parse a formation of the form "3-7-7-5" (goalkeeper, defender, midfielder,
+    forward)."""
+    counts = [int(count) for count in formation_str.split("-")]
+    if len(counts) != len(Position):
+        raise ValueError(f"Invalid formation: {formation_str}")
+    return dict(zip(sorted(Position), counts))
+
+
+def format_formation(formation):
+    return "-".join(str(formation[position]) for position in sorted(Position))
+
+
+def sweep_points(sweeps, formations):
+    """Create the cartesian product of all sweeps and formations. Neighbouring
+    points differ only in the last sweep parameter, which makes warm starts
+    effective."""
+    names = [name for name, _ in sweeps]
+    points = []
+    for formation in formations:
+        for values in itertools.product(*[values for _, values in sweeps]):
+            point = dict(zip(names, values))
+            point["formation"] = formation
+            points.append(point)
+    return points
+
+
+def set_parameters(model, point):
+    """Change the rules of the model according to the sweep point."""
+    for name, value in point.items():
+        if name == "formation":
+            for position, count in value.items():
+                model.expected_position_count[position] = count
+            model.expected_total_players = sum(value.values())
+        elif name == "budget":
+            model.maximum_ingame_value = value * 10**6
+        else:
+            getattr(model, SWEEP_PARAMETERS[name]).set_value(value)
+
+
+# The model and solver of the worker process.
+_worker_model = None
+_worker_backend = None
+
+
+def _init_worker(dataframe, builder, solver, solver_options):
+    global _worker_model, _worker_backend
+    _worker_model = choose_team.MODEL_BUILDERS[builder](dataframe)
+    _worker_backend = solvers.get_backend(solver, warmstart=True, **solver_options)
+
+
+def _solve_points(points):
+    rows = []
+    for point in points:
+        set_parameters(_worker_model, point)
+        result = _worker_backend.solve(_worker_model)
+        total_cost = sum(
+            _worker_model.cost_ingame[i]
+            for i in _worker_model.name_
+            if pyomo_env.value(_worker_model.chosen[i]) > 0.5
+        )
+        row = {**point, "formation": format_formation(point["formation"])}
+        row.update(
+            {
+                "optimal": result.optimal,
+                "market_value": result.objective if result.optimal else None,
+                "cost_ingame": total_cost if result.optimal else None,
+                "wall_time": result.wall_time,
+            }
+        )
+        rows.append(row)
+    return rows
+
+
+def run_sweep(
+    dataframe,
+    points,
+    builder="vectorized",
+    solver="highs",
+    solver_options=None,
+    processes=None,
+):
+    """Solve the model for each sweep point. The points are split into contiguous
+    chunks, one per process. Return a dataframe with one row per point."""
+    solver_options = {} if solver_options is None else solver_options
+    processes = min(processes or os.cpu_count() or 1, len(points))
+    if processes <= 1:
+        _init_worker(dataframe, builder, solver, solver_options)
+        return pd.DataFrame(_solve_points(points))
+
+    chunks = [chunk.tolist() for chunk in np.array_split(points, processes)]
+    with ProcessPoolExecutor(
+        processes,
+        initializer=_init_worker,
+        initargs=(dataframe, builder, solver, solver_options),
+    ) as executor:
+        rows = list(itertools.chain.from_iterable(executor.map(_solve_points, chunks)))
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sweep",
+        action="append",
+        default=[],
+        help=(
+            "Parameter sweep of the form name=start:stop:step, for example "
+            f"budget=40:45:0.5. Can be given multiple times. Parameters: "
+            f"{', '.join(SWEEP_PARAMETERS)}."
+        ),
+    )
+    parser.add_argument(
+        "--formations",
+        default=format_formation(choose_team.EXPECTED_POSITION_COUNTS),
+        help="Comma separated formations, for example 3-7-7-5,3-6-8-5.",
+    )
+    parser.add_argument(
+        "--model-builder",
+        choices=choose_team.MODEL_BUILDERS.keys(),
+        default="vectorized",
+        help="How to build the model. Both builders create the same model.",
+    )
+    parser.add_argument(
+        "--solver",
+        choices=solvers.BACKENDS.keys(),
+        default="highs",
+        help="Solver backend. highs supports warm starts.",
+    )
+    parser.add_argument(
+        "--time-limit",
+        default=None,
+        type=float,
+        help="Solver time limit per sweep point in seconds.",
+    )
+    parser.add_argument(
+        "--mip-gap", default=None, type=float, help="Relative MIP gap tolerance."
+    )
+    parser.add_argument(
+        "--processes",
+        default=None,
+        type=int,
+        help="Number of worker processes. Default is the number of CPUs.",
+    )
+    parser.add_argument(
+        "--output", default=None, type=Path, help="Write the results to a csv file."
+    )
+    parser.add_argument(
+        "--season",
+        default=store.CURRENT_SEASON,
+        help="First year of the season of the player data, for example 2025.",
+    )
+    args = parser.parse_args()
+
+    dataframe = store.read(
+        store.ROOT,
+        "players",
+        args.season,
+        store.PLAYERS_SCHEMA,
+        columns=store.PLAYERS_SCHEMA.names,
+    )
+    if dataframe is None:
+        raise Exception("No player data found. Run obtain_data.py first.")
+
+    sweeps = [parse_sweep(sweep_str) for sweep_str in args.sweep]
+    formations = [parse_formation(f) for f in args.formations.split(",")]
+    results = run_sweep(
+        dataframe,
+        sweep_points(sweeps, formations),
+        builder=args.model_builder,
+        solver=args.solver,
+        solver_options={"time_limit": args.time_limit, "mip_gap": args.mip_gap},
+        processes=args.processes,
+    )
+
+    if args.output is not None:
+        results.to_csv(args.output, index=False)
+    else:
+        print(results.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()